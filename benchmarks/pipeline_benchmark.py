@@ -0,0 +1,136 @@
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from src.validation import check_missing_values, validate_numeric_columns, validate_timestamp_format, validate_dataframe
+from src.aggregation import calculate_aggregated_metrics
+from src.reader import read_sensor_csv
+from benchmarks.synthetic_data import generate_station_csv
+
+logger = logging.getLogger('benchmark')
+
+
+def measure(stage, rows, func, *args, track_memory=True):
+    # Times one call, then repeats it under tracemalloc for the peak; tracing slows
+    # allocation-heavy code, so the two are never mixed.
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+
+    peak_bytes = None
+    if track_memory:
+        tracemalloc.start()
+        func(*args)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, {
+        'stage': stage,
+        'rows': rows,
+        'seconds': round(elapsed, 6),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed > 0 else None,
+        'peak_memory_bytes': peak_bytes,
+    }
+
+
+def _standin_load(df):
+    # Without a database, time building the COPY payload that copy_raw_data would send.
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S')
+    return buffer.tell()
+
+
+def _database_load(file_path):
+    def load(df):
+        from src.file_utils import save_valid_data
+        return save_valid_data(df, file_path)
+    return load
+
+
+def run_benchmark(rows, stations, missing_frac, out_of_range_frac, bad_timestamp_frac,
+                  use_database=False, track_memory=True, seed=0):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, f"bench_{rows}_{stations}.csv")
+        generate_station_csv(file_path, rows, stations=stations, missing_frac=missing_frac,
+                             out_of_range_frac=out_of_range_frac, bad_timestamp_frac=bad_timestamp_frac, seed=seed)
+        stages = []
+
+        df, result = measure('read', rows, read_sensor_csv, file_path,
+                             track_memory=track_memory)
+        stages.append(result)
+
+        stages.append(measure('check_missing_values', rows, check_missing_values, df, track_memory=track_memory)[1])
+        stages.append(measure('validate_numeric_columns', rows, lambda: validate_numeric_columns(df.copy()),
+                              track_memory=track_memory)[1])
+        stages.append(measure('validate_timestamp_format', rows, validate_timestamp_format, df,
+                              track_memory=track_memory)[1])
+
+        (valid_df, failed_df), result = measure('validate_dataframe', rows, validate_dataframe, df, logger,
+                                                track_memory=track_memory)
+        stages.append(result)
+        valid_rows = 0 if valid_df is None else len(valid_df)
+
+        if valid_rows:
+            stages.append(measure('aggregation', valid_rows, calculate_aggregated_metrics, valid_df, file_path,
+                                  track_memory=track_memory)[1])
+            load = _database_load(file_path) if use_database else _standin_load
+            # A database load is not repeatable, so it is never traced a second time.
+            stages.append(measure('db_load' if use_database else 'db_load_standin', valid_rows, load, valid_df,
+                                  track_memory=track_memory and not use_database)[1])
+
+    return {
+        'config': {
+            'rows': rows,
+            'stations': stations,
+            'missing_frac': missing_frac,
+            'out_of_range_frac': out_of_range_frac,
+            'bad_timestamp_frac': bad_timestamp_frac,
+            'database': use_database,
+            'seed': seed,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'cpu_count': os.cpu_count(),
+        },
+        'valid_rows': valid_rows,
+        'failed_rows': len(failed_df),
+        'stages': stages,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipeline stage by stage on synthetic data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--stations', type=int, default=7)
+    parser.add_argument('--missing-frac', type=float, default=0.01)
+    parser.add_argument('--out-of-range-frac', type=float, default=0.01)
+    parser.add_argument('--bad-timestamp-frac', type=float, default=0.01)
+    parser.add_argument('--database', action='store_true', help="Load into the PostgreSQL database from db/.env")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc peak-memory pass")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = [
+        run_benchmark(rows, args.stations, args.missing_frac, args.out_of_range_frac, args.bad_timestamp_frac,
+                      use_database=args.database, track_memory=not args.no_memory, seed=args.seed)
+        for rows in args.rows
+    ]
+
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(payload)
+    else:
+        print(payload)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+from config.settings import VALIDATION_RULES, CRITICAL_COLUMNS
+
+TIMESTAMP_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+BASE_STATION_NAMES = ['Oak Street', 'Foster', '63rd Street', 'Montrose', 'Ohio Street', 'Rainbow', 'Calumet']
+
+
+def station_names(count):
+    names = []
+    for i in range(count):
+        base = BASE_STATION_NAMES[i % len(BASE_STATION_NAMES)]
+        suffix = '' if i < len(BASE_STATION_NAMES) else f' {i}'
+        names.append(f"{base} Weather Station{suffix}")
+    return names
+
+
+def generate_station_frame(rows, stations=7, missing_frac=0.0, out_of_range_frac=0.0,
+                           bad_timestamp_frac=0.0, seed=0, start='2015-05-22'):
+    # Hourly readings per station with the columns the pipeline reads. The dirty
+    # fractions are applied to disjoint random row sets so each maps to one failure reason.
+    rng = np.random.default_rng(seed)
+    names = np.array(station_names(stations))
+    station_idx = np.arange(rows) % stations
+    hours = np.arange(rows) // stations
+    timestamps = pd.Timestamp(start) + pd.to_timedelta(hours, unit='h')
+
+    station_col = names[station_idx]
+    ids = (pd.Series(station_col).str.replace(' ', '', regex=False)
+           + pd.Series(timestamps.strftime('%Y%m%d%H%M')))
+
+    df = pd.DataFrame({
+        'Station Name': station_col,
+        'Measurement Timestamp': timestamps.strftime(TIMESTAMP_FORMAT),
+        'Measurement ID': ids,
+        'Air Temperature': rng.normal(18, 8, rows).round(1),
+        'Barometric Pressure': rng.normal(990, 10, rows).round(1),
+        'Humidity': rng.integers(20, 100, rows),
+    })
+    df = df.astype({'Air Temperature': object, 'Barometric Pressure': object, 'Humidity': object,
+                    'Measurement Timestamp': object})
+
+    order = rng.permutation(rows)
+    n_missing = int(rows * missing_frac)
+    n_range = int(rows * out_of_range_frac)
+    n_timestamp = int(rows * bad_timestamp_frac)
+    missing_rows = order[:n_missing]
+    range_rows = order[n_missing:n_missing + n_range]
+    timestamp_rows = order[n_missing + n_range:n_missing + n_range + n_timestamp]
+
+    missing_cols = rng.choice(CRITICAL_COLUMNS, len(missing_rows))
+    for column in CRITICAL_COLUMNS:
+        df.loc[missing_rows[missing_cols == column], column] = None
+
+    rule_cols = list(VALIDATION_RULES)
+    range_cols = rng.choice(rule_cols, len(range_rows))
+    for column in rule_cols:
+        hit = range_rows[range_cols == column]
+        df.loc[hit[::2], column] = VALIDATION_RULES[column][1] + 100
+        df.loc[hit[1::2], column] = 'n/a'
+
+    df.loc[timestamp_rows, 'Measurement Timestamp'] = 'not a timestamp'
+    return df
+
+
+def generate_station_csv(path, rows, **kwargs):
+    df = generate_station_frame(rows, **kwargs)
+    df.to_csv(path, index=False)
+    return path
@@ -8,10 +8,16 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.abspath(os.path.join(BASE_DIR, '../data'))
 LOG_DIR = os.path.abspath(os.path.join(BASE_DIR, '../logs'))
 QUARANTINE_DIR = os.path.abspath(os.path.join(BASE_DIR, '../quarantine'))
+STATE_DIR = os.path.abspath(os.path.join(BASE_DIR, '../state'))
+LEDGER_PATH = os.getenv('LEDGER_PATH', os.path.join(STATE_DIR, 'processed_files.sqlite'))
 
 TABLES = {
     'raw_sensor_data': 'raw_sensor_data',  
-    'aggregated_metrics': 'aggregated_metrics'  
+    'aggregated_metrics': 'aggregated_metrics',
+    'station_metrics': 'station_metrics',
+    'station_metrics_hourly': 'station_metrics_hourly',
+    'station_metrics_daily': 'station_metrics_daily',
+    'file_queue': 'file_queue'
     
     }
 VALIDATION_RULES = {
@@ -21,6 +27,18 @@ VALIDATION_RULES = {
 }
 
 CRITICAL_COLUMNS = ['Station Name', 'Measurement Timestamp','Measurement ID'] + list(VALIDATION_RULES.keys())
+
+# Declared CSV schema: numeric columns are the ones with range rules, the rest are text.
+CSV_DTYPES = {
+    'Station Name': 'category',
+    'Measurement Timestamp': 'string',
+    'Measurement ID': 'string',
+    **{column: 'float64' for column in VALIDATION_RULES},
+}
+# Format of 'Measurement Timestamp' in the station exports, e.g. 05/22/2015 03:00:00 PM.
+TIMESTAMP_FORMAT = os.getenv('TIMESTAMP_FORMAT', '%m/%d/%Y %I:%M:%S %p')
+# CSV parser: 'c' (default) or 'pyarrow' (multithreaded, whole-file reads only).
+CSV_ENGINE = os.getenv('CSV_ENGINE', 'c').lower()
 DB_CONFIG = {
     'database': os.getenv("DB_NAME"),
     'schema':os.getenv("DB_SCHEMA"),
@@ -30,9 +48,104 @@ DB_CONFIG = {
     'port': int(os.getenv('DB_PORT', 5432))  ,
     
     'min_connections':1,
-    'max_connections':10
+    'max_connections':10,
+    # Seconds to wait for a free pooled connection, maximum connection age before it is
+    # recycled, and idle time after which a connection is pinged before reuse.
+    'pool_timeout':30,
+    'max_connection_age':1800,
+    'health_check_idle':30
 
 }
 
+# Rows per chunk in streaming mode; 0 reads each file in a single pass.
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', 0))
+# In streaming mode, parse and validate the next chunks on a background thread while the
+# current one is written; at most PIPELINE_BUFFER_CHUNKS validated chunks wait in between.
+PIPELINE_OVERLAP = os.getenv('PIPELINE_OVERLAP', 'true').lower() == 'true'
+PIPELINE_BUFFER_CHUNKS = int(os.getenv('PIPELINE_BUFFER_CHUNKS', 2))
+
+# 'copy' streams raw rows through COPY and a staging table; 'executemany' keeps the row-wise INSERT path.
+RAW_LOAD_METHOD = os.getenv('RAW_LOAD_METHOD', 'copy').lower()
+
+# What to do when aggregated_metrics already holds a (source_file, station_name) row: 'overwrite' or 'skip'.
+AGGREGATE_CONFLICT_MODE = os.getenv('AGGREGATE_CONFLICT_MODE', 'overwrite').lower()
+
+# Raw data partitions older than this many months are detached at startup (0 keeps all);
+# set RAW_PARTITION_DROP=true to drop them instead of leaving them as standalone tables.
+RAW_PARTITION_RETENTION_MONTHS = int(os.getenv('RAW_PARTITION_RETENTION_MONTHS', 0))
+RAW_PARTITION_DROP = os.getenv('RAW_PARTITION_DROP', 'false').lower() == 'true'
+
+# In-memory measurement_id index used to drop already-loaded rows before any SQL is sent.
+# It covers measurements from the last DEDUP_WARM_MONTHS months (0 for all of them) and holds
+# at most DEDUP_MAX_KEYS IDs per worker (0 for no cap), dropping its oldest months first.
+DEDUP_INDEX = os.getenv('DEDUP_INDEX', 'true').lower() == 'true'
+DEDUP_WARM_MONTHS = int(os.getenv('DEDUP_WARM_MONTHS', 3))
+DEDUP_MAX_KEYS = int(os.getenv('DEDUP_MAX_KEYS', 10_000_000))
+
+# Parallel workers (one raw data partition each) for `python main.py --backfill-rollups`.
+ROLLUP_BACKFILL_WORKERS = int(os.getenv('ROLLUP_BACKFILL_WORKERS', 4))
+
+# Retries: transient DB errors back off with full jitter up to RETRY_MAX_DELAY seconds and give up
+# after RETRY_DEADLINE seconds. After BREAKER_FAILURE_THRESHOLD consecutive transient failures the
+# circuit breaker pauses DB work for BREAKER_RESET_TIMEOUT seconds before letting one probe through.
+RETRY_DEADLINE = float(os.getenv('RETRY_DEADLINE', 120))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 30))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 30))
+
+# File dispatcher: 'process' or 'thread' workers, and how many files may be queued or running at once.
+WORKER_MODE = os.getenv('WORKER_MODE', 'process').lower()
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', os.cpu_count() or 1))
+MAX_PENDING_FILES = int(os.getenv('MAX_PENDING_FILES', 100))
+
+# Micro-batching: files up to MICRO_BATCH_MAX_FILE_BYTES are grouped, up to MICRO_BATCH_MAX_FILES
+# files or MICRO_BATCH_LATENCY seconds after the first one, and loaded in shared transactions of
+# about MICRO_BATCH_ROWS rows. MICRO_BATCH_MAX_FILES=0 processes every file on its own.
+MICRO_BATCH_MAX_FILES = int(os.getenv('MICRO_BATCH_MAX_FILES', 0))
+MICRO_BATCH_LATENCY = float(os.getenv('MICRO_BATCH_LATENCY', 1.0))
+MICRO_BATCH_ROWS = int(os.getenv('MICRO_BATCH_ROWS', 50000))
+MICRO_BATCH_MAX_FILE_BYTES = int(os.getenv('MICRO_BATCH_MAX_FILE_BYTES', 1024 * 1024))
+
+# Shared work queue: with WORK_QUEUE=true several instances can watch one DATA_DIR. Discovered
+# files are registered in PostgreSQL and claimed by workers under a lease that a heartbeat renews;
+# files whose lease expires are handed to another worker, up to WORK_QUEUE_MAX_ATTEMPTS times.
+WORK_QUEUE = os.getenv('WORK_QUEUE', 'false').lower() == 'true'
+WORK_QUEUE_LEASE_SECONDS = float(os.getenv('WORK_QUEUE_LEASE_SECONDS', 60))
+WORK_QUEUE_HEARTBEAT = float(os.getenv('WORK_QUEUE_HEARTBEAT', 15))
+WORK_QUEUE_POLL_INTERVAL = float(os.getenv('WORK_QUEUE_POLL_INTERVAL', 1))
+WORK_QUEUE_MAX_ATTEMPTS = int(os.getenv('WORK_QUEUE_MAX_ATTEMPTS', 3))
+
+# File readiness: poll interval for the size/mtime stability check, and how long to wait before giving up.
+FILE_STABLE_INTERVAL = float(os.getenv('FILE_STABLE_INTERVAL', 0.25))
+FILE_READY_TIMEOUT = float(os.getenv('FILE_READY_TIMEOUT', 300))
+
+# Quarantine output: 'parquet' or 'arrow' (IPC) files partitioned by date and failure category
+# (needs pyarrow), or 'csv' for a single failed_<file> CSV per input file.
+QUARANTINE_FORMAT = os.getenv('QUARANTINE_FORMAT', 'parquet').lower()
+ERROR_LOG_FLUSH_INTERVAL = float(os.getenv('ERROR_LOG_FLUSH_INTERVAL', 1))
+
+# Metrics: Prometheus-style endpoint port (0 disables it) and how often worker processes dump JSON snapshots.
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_DUMP_INTERVAL = float(os.getenv('METRICS_DUMP_INTERVAL', 15))
+METRICS_DIR = os.path.join(LOG_DIR, 'metrics')
+
+# Read-side query endpoint: port (0 disables it), and how long and how many results are cached.
+# Cached results are also dropped per station as soon as new rows for that station commit.
+QUERY_PORT = int(os.getenv('QUERY_PORT', 0))
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', 30))
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', 256))
+
 DEBUG = os.getenv('DEBUG', 'false').lower() == 'true'
 
+# Logging: records are queued and written by a background listener to a rotating app.log and the
+# console. LOG_FORMAT is 'text' or 'json'. Each call site may emit LOG_RATE_LIMIT warnings
+# per LOG_RATE_INTERVAL seconds (0 disables the limit); when LOG_QUEUE_SIZE records are waiting,
+# further records are dropped and counted rather than blocking the pipeline.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 10))
+LOG_RATE_INTERVAL = float(os.getenv('LOG_RATE_INTERVAL', 1))
+
@@ -1,119 +1,507 @@
 from psycopg2 import pool
-from config.settings import DB_CONFIG, TABLES
+from psycopg2.extras import execute_values
+from config.settings import DB_CONFIG, TABLES, AGGREGATE_CONFLICT_MODE, ROLLUP_BACKFILL_WORKERS
 from src.logger import get_logger
+from src.metrics import timed, timer, inc, set_gauge
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.extensions
 import pandas as pd
+import io
+import os
+import threading
+import time
 from db.retry_utils import retry_operation
+from src.aggregation import combine_partial_metrics
 
 logger = get_logger(__name__)
 
 schema_name = DB_CONFIG['schema']
 raw_sensor_table = f"{schema_name}.{TABLES['raw_sensor_data']}"
 aggregated_metrics_table = f"{schema_name}.{TABLES['aggregated_metrics']}"
+station_metrics_table = f"{schema_name}.{TABLES['station_metrics']}"
+file_queue_table = f"{schema_name}.{TABLES['file_queue']}"
 
-connection_pool = pool.SimpleConnectionPool(
-    DB_CONFIG['min_connections'],  
-    DB_CONFIG['max_connections'],  
-    host=DB_CONFIG['host'],
-    database=DB_CONFIG['database'],
-    user=DB_CONFIG['user'],
-    password=DB_CONFIG['password']
-)
+# Time-bucketed rollups of the station state: granularity -> (table, pandas freq, date_trunc unit).
+ROLLUPS = {
+    'hourly': (f"{schema_name}.{TABLES['station_metrics_hourly']}", 'h', 'hour'),
+    'daily': (f"{schema_name}.{TABLES['station_metrics_daily']}", 'D', 'day'),
+}
 
-def get_db_connection():
-    return connection_pool.getconn()
+STATE_MEASUREMENTS = ['temp', 'humidity', 'pressure']
+
+# The pool is created on first use, so importing this module never needs the database,
+# and re-created in a forked child rather than sharing the parent's sockets. A semaphore
+# caps checkouts at max_connections so callers wait instead of getting PoolError.
+connection_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+_connection_created = {}
+_connection_last_used = {}
+_checked_out = 0
+
+
+def _get_pool():
+    global connection_pool, _pool_pid, _pool_slots
+    with _pool_lock:
+        if connection_pool is None or _pool_pid != os.getpid():
+            _connection_created.clear()
+            _connection_last_used.clear()
+            connection_pool = pool.ThreadedConnectionPool(
+                DB_CONFIG['min_connections'],
+                DB_CONFIG['max_connections'],
+                host=DB_CONFIG['host'],
+                port=DB_CONFIG['port'],
+                database=DB_CONFIG['database'],
+                user=DB_CONFIG['user'],
+                password=DB_CONFIG['password']
+            )
+            _pool_slots = threading.BoundedSemaphore(DB_CONFIG['max_connections'])
+            _pool_pid = os.getpid()
+            logger.info(f"Database connection pool created (max {DB_CONFIG['max_connections']} connections).")
+        return connection_pool, _pool_slots
+
+
+def _track_checkout(delta):
+    global _checked_out
+    with _pool_lock:
+        _checked_out += delta
+        set_gauge('db_pool_connections_in_use', _checked_out)
+
+
+def _forget_connection(conn):
+    _connection_created.pop(id(conn), None)
+    _connection_last_used.pop(id(conn), None)
+
+
+def _is_healthy(conn):
+    now = time.monotonic()
+    created = _connection_created.setdefault(id(conn), now)
+    if conn.closed or now - created > DB_CONFIG['max_connection_age']:
+        return False
+    if now - _connection_last_used.get(id(conn), now) < DB_CONFIG['health_check_idle']:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def get_db_connection(timeout=None):
+    db_pool, slots = _get_pool()
+    timeout = DB_CONFIG['pool_timeout'] if timeout is None else timeout
+    with timer('db_pool_wait_seconds'):
+        if not slots.acquire(timeout=timeout):
+            raise pool.PoolError(f"Timed out after {timeout}s waiting for a database connection")
+    try:
+        conn = db_pool.getconn()
+        # After a database restart every idle connection is dead, so keep discarding until
+        # one passes the check or the pool opens a new one.
+        while id(conn) in _connection_created and not _is_healthy(conn):
+            inc('db_pool_recycled_total')
+            _forget_connection(conn)
+            db_pool.putconn(conn, close=True)
+            conn = db_pool.getconn()
+        _connection_created.setdefault(id(conn), time.monotonic())
+    except Exception:
+        slots.release()
+        raise
+    _track_checkout(1)
+    return conn
 
 def release_db_connection(conn):
-    connection_pool.putconn(conn)
+    db_pool, slots = _get_pool()
+    close = bool(conn.closed)
+    if not close and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        # Never hand a connection with an open or failed transaction to the next caller.
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            close = True
+    if close:
+        _forget_connection(conn)
+    else:
+        _connection_last_used[id(conn)] = time.monotonic()
+    try:
+        db_pool.putconn(conn, close=close)
+    finally:
+        slots.release()
+        _track_checkout(-1)
 
-def close_connection_pool():
-    connection_pool.closeall()
+@contextmanager
+def db_connection():
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        release_db_connection(conn)
 
-def create_schema_if_not_exist(conn):
+def listen_connection(channel):
+    # Dedicated autocommit connection outside the pool, for LISTEN; the caller closes it.
+    conn = psycopg2.connect(host=DB_CONFIG['host'], port=DB_CONFIG['port'], database=DB_CONFIG['database'],
+                            user=DB_CONFIG['user'], password=DB_CONFIG['password'])
+    conn.set_session(autocommit=True)
     with conn.cursor() as cursor:
-        cursor.execute(f"""CREATE SCHEMA IF NOT EXISTS {schema_name};""")
-        
+        cursor.execute(f"LISTEN {channel};")
+    return conn
+
+
+def close_connection_pool():
+    global connection_pool
+    with _pool_lock:
+        if connection_pool is not None and _pool_pid == os.getpid():
+            connection_pool.closeall()
+        connection_pool = None
+
+def _create_base_tables(cursor):
+    # IF NOT EXISTS keeps this safe on databases created before migrations were tracked.
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {raw_sensor_table} (
+        station_name TEXT NOT NULL,
+        measurement_timestamp TIMESTAMP NOT NULL,
+        air_temperature REAL,
+        humidity INT,
+        barometric_pressure REAL,
+        processed_at TIMESTAMP DEFAULT NOW(),
+        measurement_id TEXT NOT NULL UNIQUE,
+        PRIMARY KEY (measurement_id)
+    );
+    """)
+    cursor.execute(f"""
+    CREATE INDEX IF NOT EXISTS idx_raw_sensor_station_time
+    ON {raw_sensor_table} (station_name, measurement_timestamp);
+    """)
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {aggregated_metrics_table} (
+        source_file TEXT NOT NULL ,
+        station_name TEXT NOT NULL,
+        min_temp REAL,
+        max_temp REAL,
+        avg_temp REAL,
+        std_temp REAL,
+        min_humidity INT,
+        max_humidity INT,
+        avg_humidity REAL,
+        std_humidity REAL,
+        min_pressure REAL,
+        max_pressure REAL,
+        avg_pressure REAL,
+        std_pressure REAL,
+        processed_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (source_file, station_name)
+    );
+    """)
+    cursor.execute(f"""
+    CREATE INDEX IF NOT EXISTS idx_aggregated_metrics_station_name
+    ON {aggregated_metrics_table} (station_name, source_file);
+    """)
+
+
+def _create_station_metrics(cursor):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {station_metrics_table} (
+        station_name TEXT NOT NULL,
+        row_count BIGINT NOT NULL,
+        mean_temp DOUBLE PRECISION,
+        m2_temp DOUBLE PRECISION,
+        min_temp REAL,
+        max_temp REAL,
+        mean_humidity DOUBLE PRECISION,
+        m2_humidity DOUBLE PRECISION,
+        min_humidity REAL,
+        max_humidity REAL,
+        mean_pressure DOUBLE PRECISION,
+        m2_pressure DOUBLE PRECISION,
+        min_pressure REAL,
+        max_pressure REAL,
+        updated_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (station_name)
+    );
+    """)
+
+
+def _create_rollup_tables(cursor):
+    for table, _, _ in ROLLUPS.values():
+        index_name = f"idx_{table.split('.')[-1]}_bucket"
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            station_name TEXT NOT NULL,
+            bucket_start TIMESTAMP NOT NULL,
+            row_count BIGINT NOT NULL,
+            mean_temp DOUBLE PRECISION,
+            m2_temp DOUBLE PRECISION,
+            min_temp REAL,
+            max_temp REAL,
+            mean_humidity DOUBLE PRECISION,
+            m2_humidity DOUBLE PRECISION,
+            min_humidity REAL,
+            max_humidity REAL,
+            mean_pressure DOUBLE PRECISION,
+            m2_pressure DOUBLE PRECISION,
+            min_pressure REAL,
+            max_pressure REAL,
+            updated_at TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (station_name, bucket_start)
+        );
+        """)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} (bucket_start);")
+
+
+def _create_file_queue(cursor):
+    # One row per file in DATA_DIR, keyed by its name relative to that directory so hosts
+    # that mount the share at different paths agree. status: pending, processing, done, failed.
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {file_queue_table} (
+        file_name TEXT PRIMARY KEY,
+        size BIGINT NOT NULL,
+        mtime_ns BIGINT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        wait_for_ready BOOLEAN NOT NULL DEFAULT FALSE,
+        attempts INT NOT NULL DEFAULT 0,
+        worker_id TEXT,
+        lease_expires_at TIMESTAMPTZ,
+        enqueued_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        started_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ,
+        last_error TEXT
+    );
+    """)
+    cursor.execute(f"""
+    CREATE INDEX IF NOT EXISTS idx_file_queue_open
+    ON {file_queue_table} (enqueued_at) WHERE status IN ('pending', 'processing');
+    """)
+
+
+def _partition_name(month):
+    return f"{TABLES['raw_sensor_data']}_p{month:%Y%m}"
 
-def table_exists(conn, table_name):
+
+def _create_raw_partition(cursor, month):
+    start = pd.Timestamp(month).to_period('M').to_timestamp()
+    end = start + pd.offsets.MonthBegin(1)
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {schema_name}.{_partition_name(start)}
+    PARTITION OF {raw_sensor_table}
+    FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}');
+    """)
+    return _partition_name(start)
+
+
+def _partition_raw_sensor_data(cursor):
+    # Rebuilds raw_sensor_data as a table range-partitioned by month on measurement_timestamp.
+    # A partitioned table's unique keys must include the partition column; measurement_id
+    # already encodes the timestamp, so (measurement_id, measurement_timestamp) is equivalent.
+    cursor.execute("""
+        SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+    """, (schema_name, TABLES['raw_sensor_data']))
+    row = cursor.fetchone()
+    if row is not None and row[0] == 'p':
+        return
+
+    legacy_table = f"{TABLES['raw_sensor_data']}_legacy"
+    if row is not None:
+        cursor.execute(f"ALTER TABLE {raw_sensor_table} RENAME TO {legacy_table};")
+        for index in ('idx_raw_sensor_station_time', f"{TABLES['raw_sensor_data']}_pkey",
+                      f"{TABLES['raw_sensor_data']}_measurement_id_key"):
+            cursor.execute(f"ALTER INDEX IF EXISTS {schema_name}.{index} RENAME TO {index}_legacy;")
+
+    cursor.execute(f"""
+    CREATE TABLE {raw_sensor_table} (
+        station_name TEXT NOT NULL,
+        measurement_timestamp TIMESTAMP NOT NULL,
+        air_temperature REAL,
+        humidity INT,
+        barometric_pressure REAL,
+        processed_at TIMESTAMP DEFAULT NOW(),
+        measurement_id TEXT NOT NULL,
+        PRIMARY KEY (measurement_id, measurement_timestamp)
+    ) PARTITION BY RANGE (measurement_timestamp);
+    """)
+    cursor.execute(f"""
+    CREATE INDEX idx_raw_sensor_station_time
+    ON {raw_sensor_table} (station_name, measurement_timestamp);
+    """)
+    # BRIN stays tiny because rows arrive roughly in time order within each partition.
+    cursor.execute(f"""
+    CREATE INDEX idx_raw_sensor_time_brin
+    ON {raw_sensor_table} USING brin (measurement_timestamp);
+    """)
+
+    if row is not None:
+        cursor.execute(f"""
+            SELECT DISTINCT date_trunc('month', measurement_timestamp)
+            FROM {schema_name}.{legacy_table}
+        """)
+        months = [month for (month,) in cursor.fetchall()]
+        for month in months:
+            _create_raw_partition(cursor, month)
+        cursor.execute(f"""
+            INSERT INTO {raw_sensor_table}
+            SELECT station_name, measurement_timestamp, air_temperature, humidity,
+                   barometric_pressure, processed_at, measurement_id
+            FROM {schema_name}.{legacy_table}
+        """)
+        cursor.execute(f"DROP TABLE {schema_name}.{legacy_table};")
+        logger.info(f"Moved existing rows of {raw_sensor_table} into {len(months)} monthly partitions.")
+
+
+# Append new versions at the end; applied versions are recorded in schema_migrations.
+SCHEMA_MIGRATIONS = [
+    (1, "raw_sensor_data and aggregated_metrics tables", _create_base_tables),
+    (2, "station_metrics running aggregates", _create_station_metrics),
+    (3, "monthly range partitions and BRIN index on raw_sensor_data", _partition_raw_sensor_data),
+    (4, "hourly and daily station metrics rollups", _create_rollup_tables),
+    (5, "file_queue for multi-instance ingestion", _create_file_queue),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+schema_migrations_table = f"{schema_name}.schema_migrations"
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def apply_migrations(conn):
     with conn.cursor() as cursor:
-        cursor.execute("""SELECT EXISTS (
-                SELECT 1
-                FROM information_schema.tables
-                WHERE table_schema = %s AND table_name = %s
-            );
-        """, (schema_name, table_name))
-        return cursor.fetchone()[0]
-
-def index_exists(conn, table_name, index_name):
-    
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name};")
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema_migrations_table} (
+            version INT PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        );
+        """)
+        # Serializes concurrent bootstraps from several workers or hosts.
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (schema_migrations_table,))
+        cursor.execute(f"SELECT COALESCE(MAX(version), 0) FROM {schema_migrations_table}")
+        current = cursor.fetchone()[0]
+        if current > SCHEMA_VERSION:
+            raise RuntimeError(f"Database schema version {current} is newer than this code supports ({SCHEMA_VERSION}).")
+
+        for version, description, migrate in SCHEMA_MIGRATIONS:
+            if version <= current:
+                continue
+            migrate(cursor)
+            cursor.execute(f"INSERT INTO {schema_migrations_table} (version, description) VALUES (%s, %s)",
+                           (version, description))
+            logger.info(f"Applied schema migration {version}: {description}.")
+    conn.commit()
+    return max(current, SCHEMA_VERSION)
+
+
+def bootstrap_schema():
+    # Runs the migration check once per process; later calls return without touching the database.
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+
+        def schema_bootstrap():
+            with db_connection() as conn:
+                return apply_migrations(conn)
+
+        version = retry_operation(schema_bootstrap)
+        _schema_ready = True
+        logger.info(f"Database schema is at version {version}.")
+
+
+_known_partitions = None
+_partitions_lock = threading.Lock()
+
+
+def list_raw_partitions(conn):
     with conn.cursor() as cursor:
         cursor.execute("""
-            SELECT EXISTS (
-                SELECT 1
-                FROM pg_indexes
-                WHERE schemaname = %s AND tablename = %s AND indexname = %s
-            );
-        """, (schema_name, table_name, index_name))
-        return cursor.fetchone()[0]
-
-def create_tables_if_not_exist(conn):
-    def table_creation():
-        with conn.cursor() as cursor:
-            if not table_exists(conn, TABLES['raw_sensor_data']):
-                cursor.execute(f"""
-                CREATE TABLE {raw_sensor_table} (
-                    station_name TEXT NOT NULL,
-                    measurement_timestamp TIMESTAMP NOT NULL,
-                    air_temperature REAL,
-                    humidity INT,
-                    barometric_pressure REAL,
-                    processed_at TIMESTAMP DEFAULT NOW(),
-                    measurement_id TEXT NOT NULL UNIQUE,
-                    PRIMARY KEY (measurement_id)
-                );
-                """)
-                logger.info(f"Table '{raw_sensor_table}' created.")
-            if not index_exists(conn, TABLES['raw_sensor_data'], 'idx_raw_sensor_station_time'):
-                cursor.execute(f"""
-                CREATE INDEX idx_raw_sensor_station_time
-                ON {raw_sensor_table} (station_name, measurement_timestamp);
-                """)
-                logger.info(f"Index 'idx_raw_sensor_station_time' created for '{raw_sensor_table}'.")
-            
-            if not table_exists(conn, TABLES['aggregated_metrics']):
-                cursor.execute(f"""
-                CREATE TABLE {aggregated_metrics_table} (
-                    source_file TEXT NOT NULL ,
-                    station_name TEXT NOT NULL,
-                    min_temp REAL,
-                    max_temp REAL,
-                    avg_temp REAL,
-                    std_temp REAL,
-                    min_humidity INT,
-                    max_humidity INT,
-                    avg_humidity REAL,
-                    std_humidity REAL,
-                    min_pressure REAL,
-                    max_pressure REAL,
-                    avg_pressure REAL,
-                    std_pressure REAL,
-                    processed_at TIMESTAMP DEFAULT NOW(),
-                    PRIMARY KEY (source_file, station_name)
-                );
-                """)
-                logger.info(f"Table '{aggregated_metrics_table}' created.")
-            if not index_exists(conn, TABLES['aggregated_metrics'], 'idx_aggregated_metrics_station_name'):
-                cursor.execute(f"""
-                CREATE INDEX idx_aggregated_metrics_station_name
-                ON {aggregated_metrics_table} (station_name, source_file);
-                """)
-                logger.info(f"Index 'idx_aggregated_metrics_station_name' created for '{aggregated_metrics_table}'.")
-            
+            SELECT child.relname
+            FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            JOIN pg_namespace n ON n.oid = parent.relnamespace
+            WHERE n.nspname = %s AND parent.relname = %s
+            ORDER BY child.relname
+        """, (schema_name, TABLES['raw_sensor_data']))
+        return [name for (name,) in cursor.fetchall()]
+
+
+def ensure_raw_partitions(conn, timestamps):
+    # Creates any missing monthly partitions for the batch in a short transaction of its own.
+    # Known partitions are cached per process, so the common case runs no SQL at all.
+    global _known_partitions
+    months = pd.Series(timestamps).dt.to_period('M').dropna().unique()
+    with _partitions_lock:
+        if _known_partitions is None:
+            _known_partitions = set(list_raw_partitions(conn))
             conn.commit()
+        missing = [month for month in months if _partition_name(month.to_timestamp()) not in _known_partitions]
+        if not missing:
+            return []
+
+        with conn.cursor() as cursor:
+            # Serializes partition creation across workers; released at commit.
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (raw_sensor_table,))
+            created = [_create_raw_partition(cursor, month.to_timestamp()) for month in missing]
+        conn.commit()
+        _known_partitions.update(created)
+    logger.info(f"Ensured raw data partitions: {', '.join(created)}.")
+    return created
+
+
+def detach_partitions_older_than(conn, months, drop=False):
+    # Detaches (and optionally drops) monthly partitions that end before the cutoff.
+    global _known_partitions
+    cutoff = (pd.Timestamp.now().to_period('M') - months).to_timestamp()
+    prefix = f"{TABLES['raw_sensor_data']}_p"
+    detached = []
+    with conn.cursor() as cursor:
+        for name in list_raw_partitions(conn):
+            if not name.startswith(prefix):
+                continue
+            month = pd.Timestamp(f"{name[len(prefix):]}01")
+            if month + pd.offsets.MonthBegin(1) > cutoff:
+                continue
+            cursor.execute(f"ALTER TABLE {raw_sensor_table} DETACH PARTITION {schema_name}.{name};")
+            if drop:
+                cursor.execute(f"DROP TABLE {schema_name}.{name};")
+            detached.append(name)
+    conn.commit()
+    with _partitions_lock:
+        if _known_partitions is not None:
+            _known_partitions.difference_update(detached)
+    if detached:
+        logger.info(f"{'Dropped' if drop else 'Detached'} {len(detached)} raw data partitions: {', '.join(detached)}.")
+    return detached
+
 
-    retry_operation(table_creation)
+def iter_measurement_ids(conn, since=None, batch_size=100000):
+    # Streams (station_name, measurement_timestamp, measurement_id) frames through a server-side cursor.
+    query = f"SELECT station_name, measurement_timestamp, measurement_id FROM {raw_sensor_table}"
+    params = None
+    if since is not None:
+        query += " WHERE measurement_timestamp >= %s"
+        params = (pd.Timestamp(since).to_pydatetime(),)
+    with conn.cursor(name='measurement_id_scan') as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=['station_name', 'measurement_timestamp', 'measurement_id'])
 
-def insert_raw_data(conn, cursor, raw_data, cols):
+
+@timed('insert_raw_data')
+def insert_raw_data(conn, cursor, df, cols):
+    # cols names the frame columns in the order of the INSERT column list below.
+    # Returns the measurement IDs that were inserted.
+    raw_data = list(df[cols].itertuples(index=False, name=None))
+    id_position = cols.index('Measurement ID')
     valid_rows = []  
     invalid_rows = []  
 
@@ -130,6 +518,7 @@ def insert_raw_data(conn, cursor, raw_data, cols):
         VALUES (%s, %s, %s, %s, %s, %s, NOW())
     """
     
+    start = time.perf_counter()
     try:
         cursor.executemany(raw_data_query, raw_data)
         conn.commit() 
@@ -149,56 +538,321 @@ def insert_raw_data(conn, cursor, raw_data, cols):
                 conn.rollback()  
                 invalid_rows.append(row)
 
-    logger.info(f"Successfully inserted {len(valid_rows)} rows, failed to insert {len(invalid_rows)} rows.")
-    
-    rdf = pd.DataFrame(valid_rows, columns=cols)
-    return rdf
+    elapsed = time.perf_counter() - start
+    inc('db_rows_total', len(valid_rows), table=TABLES['raw_sensor_data'], result='inserted')
+    inc('db_rows_total', len(invalid_rows), table=TABLES['raw_sensor_data'], result='failed')
+    logger.info(f"Successfully inserted {len(valid_rows)} rows, failed to insert {len(invalid_rows)} rows "
+                f"({_rows_per_sec(len(raw_data), elapsed):.0f} rows/sec).")
+
+    return [row[id_position] for row in valid_rows]
+
+
+def _rows_per_sec(rows, elapsed):
+    return rows / elapsed if elapsed > 0 else float('inf')
+
+
+RAW_STAGING_TABLE = 'raw_sensor_staging'
+RAW_COPY_COLUMNS = ['station_name', 'measurement_timestamp', 'air_temperature',
+                    'humidity', 'barometric_pressure', 'measurement_id']
+
+
+@timed('copy_raw_data')
+def copy_raw_data(conn, cursor, df, cols):
+    # Streams rows through COPY into a per-connection temp table, then merges them
+    # into the raw table in one statement; call ensure_raw_partitions first. Returns the measurement IDs actually inserted;
+    # the caller commits so dependent writes can share the transaction.
+    start = time.perf_counter()
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {RAW_STAGING_TABLE} (
+            station_name TEXT,
+            measurement_timestamp TIMESTAMP,
+            air_temperature REAL,
+            humidity DOUBLE PRECISION,
+            barometric_pressure REAL,
+            measurement_id TEXT
+        ) ON COMMIT DELETE ROWS;
+    """)
+
+    buffer = io.StringIO()
+    df.to_csv(buffer, columns=cols, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S')
+    buffer.seek(0)
+
+    column_list = ', '.join(RAW_COPY_COLUMNS)
+    try:
+        cursor.copy_expert(f"COPY {RAW_STAGING_TABLE} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(f"""
+            INSERT INTO {raw_sensor_table} ({column_list}, processed_at)
+            SELECT {column_list}, NOW() FROM {RAW_STAGING_TABLE}
+            ON CONFLICT (measurement_id, measurement_timestamp) DO NOTHING
+            RETURNING measurement_id
+        """)
+        inserted_ids = [row[0] for row in cursor.fetchall()]
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+
+    elapsed = time.perf_counter() - start
+    inc('db_rows_total', len(inserted_ids), table=TABLES['raw_sensor_data'], result='inserted')
+    inc('db_rows_total', len(df) - len(inserted_ids), table=TABLES['raw_sensor_data'], result='skipped')
+    logger.info(f"COPY loaded {len(df)} rows, inserted {len(inserted_ids)}, skipped {len(df) - len(inserted_ids)} "
+                f"existing rows ({_rows_per_sec(len(df), elapsed):.0f} rows/sec).")
+    return inserted_ids
+
+
+AGGREGATED_METRIC_COLUMNS = [
+    'min_temp', 'max_temp', 'avg_temp', 'std_temp',
+    'min_humidity', 'max_humidity', 'avg_humidity', 'std_humidity',
+    'min_pressure', 'max_pressure', 'avg_pressure', 'std_pressure',
+]
 
 
-def insert_aggregated_data(conn, cursor, aggregated_metrics):
+@timed('insert_aggregated_data')
+def insert_aggregated_data(conn, cursor, aggregated_metrics, on_conflict=AGGREGATE_CONFLICT_MODE):
+    # One set-based statement: 'skip' keeps existing (source_file, station_name) rows,
+    # 'overwrite' replaces them. Returns (inserted, updated) counts.
+    if not aggregated_metrics:
+        return 0, 0
+
+    if on_conflict == 'overwrite':
+        updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in AGGREGATED_METRIC_COLUMNS)
+        conflict_action = f"DO UPDATE SET {updates}, processed_at = NOW()"
+    elif on_conflict == 'skip':
+        conflict_action = "DO NOTHING"
+    else:
+        raise ValueError(f"Unknown conflict mode for aggregated metrics: {on_conflict}")
+
     aggregated_data_query = f"""
         INSERT INTO {aggregated_metrics_table} (
             source_file,
             station_name,
-            min_temp,
-            max_temp,
-            avg_temp,
-            std_temp,
-            min_humidity,
-            max_humidity,
-            avg_humidity,
-            std_humidity,
-            min_pressure,
-            max_pressure,
-            avg_pressure,
-            std_pressure,
+            {', '.join(AGGREGATED_METRIC_COLUMNS)},
             processed_at
         )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+        VALUES %s
+        ON CONFLICT (source_file, station_name) {conflict_action}
+        RETURNING (xmax = 0) AS inserted
     """
+    template = f"({', '.join(['%s'] * (len(AGGREGATED_METRIC_COLUMNS) + 2))}, NOW())"
 
-    valid_rows = []
-    invalid_rows = []
-    
-    for row in aggregated_metrics:
-        try:
-            cursor.execute(f"""
-                SELECT 1 FROM {aggregated_metrics_table} WHERE source_file = %s AND station_name = %s
-            """, (row[0], row[1]))  
-            if cursor.fetchone() is None:  
-                valid_rows.append(row)
-            else:
-                invalid_rows.append(row)
-        except Exception as e:
-            logger.error(f"Error checking primary key for row {row}: {e}")
-            invalid_rows.append(row)
+    results = execute_values(cursor, aggregated_data_query, aggregated_metrics, template=template, fetch=True)
+    conn.commit()
+
+    inserted = sum(1 for (is_insert,) in results if is_insert)
+    updated = len(results) - inserted
+    skipped = len(aggregated_metrics) - len(results)
+    logger.info(f"{inserted} rows inserted, {updated} rows updated in {aggregated_metrics_table}.")
+    if skipped:
+        logger.warning(f"Skipped {skipped} rows that already exist in {aggregated_metrics_table}.")
+
+    return inserted, updated
 
-    if valid_rows:
-        cursor.executemany(aggregated_data_query, valid_rows)
+
+# Carries the names of stations whose data changed; PostgreSQL delivers it only on commit.
+# A payload of '*' means every station.
+STATION_UPDATES_CHANNEL = 'station_updates'
+
+
+def notify_station_updates(cursor, station_names):
+    names = sorted({str(name) for name in station_names})
+    if not names:
+        return
+    # NOTIFY payloads are capped at 8000 bytes; a long list just invalidates everything.
+    payload = '\n'.join(names)
+    if len(payload.encode()) > 7900:
+        payload = '*'
+    cursor.execute("SELECT pg_notify(%s, %s)", (STATION_UPDATES_CHANNEL, payload))
+
+
+def _state_columns():
+    columns = ['row_count']
+    for key in STATE_MEASUREMENTS:
+        columns += [f'mean_{key}', f'm2_{key}', f'min_{key}', f'max_{key}']
+    return columns
+
+
+def _merge_state_query(table, key_columns):
+    # Upsert of mergeable state: counts add up, means and M2 combine with Chan's
+    # pairwise formula, min/max take the extremes. SET expressions see the old row.
+    columns = key_columns + _state_columns()
+    n_old = "cur.row_count::DOUBLE PRECISION"
+    n_new = "EXCLUDED.row_count::DOUBLE PRECISION"
+    n_total = f"({n_old} + {n_new})"
+    assignments = ["row_count = cur.row_count + EXCLUDED.row_count"]
+    for key in STATE_MEASUREMENTS:
+        delta = f"(EXCLUDED.mean_{key} - cur.mean_{key})"
+        assignments += [
+            f"mean_{key} = cur.mean_{key} + {delta} * {n_new} / {n_total}",
+            f"m2_{key} = cur.m2_{key} + EXCLUDED.m2_{key} + {delta} * {delta} * {n_old} * {n_new} / {n_total}",
+            f"min_{key} = LEAST(cur.min_{key}, EXCLUDED.min_{key})",
+            f"max_{key} = GREATEST(cur.max_{key}, EXCLUDED.max_{key})",
+        ]
+    assignments.append("updated_at = NOW()")
+    return f"""
+        INSERT INTO {table} AS cur ({', '.join(columns)})
+        VALUES %s
+        ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET
+            {', '.join(assignments)}
+    """
+
+
+def update_station_metrics(cursor, partial_metrics):
+    # partial_metrics is the per-station frame from calculate_partial_metrics; the
+    # stored state is updated in O(stations) without rescanning raw data.
+    if partial_metrics is None or partial_metrics.empty:
+        return 0
+    state = partial_metrics.rename(columns={'count': 'row_count'})
+    rows = list(state[_state_columns()].reset_index().itertuples(index=False, name=None))
+    execute_values(cursor, _merge_state_query(station_metrics_table, ['station_name']), rows)
+    logger.info(f"Updated running metrics for {len(rows)} stations.")
+    return len(rows)
+
+
+def update_rollup_metrics(cursor, granularity, partial_metrics):
+    # partial_metrics comes from calculate_bucket_metrics with this granularity's freq.
+    if partial_metrics is None or partial_metrics.empty:
+        return 0
+    state = partial_metrics.rename(columns={'count': 'row_count'})
+    rows = list(state[_state_columns()].reset_index().itertuples(index=False, name=None))
+    execute_values(cursor, _merge_state_query(ROLLUPS[granularity][0], ['station_name', 'bucket_start']), rows)
+    logger.info(f"Updated {len(rows)} {granularity} rollup buckets.")
+    return len(rows)
+
+
+def _rebuild_partition_rollups(partition):
+    # Recomputes every rollup bucket of one monthly partition from its raw rows. The SHARE
+    # lock holds off concurrent loads into that month until the rebuilt buckets commit, so
+    # rows loaded meanwhile are neither lost nor counted twice.
+    prefix = f"{TABLES['raw_sensor_data']}_p"
+    month = pd.Timestamp(f"{partition[len(prefix):]}01")
+    start, end = month, month + pd.offsets.MonthBegin(1)
+    aggregates = ["COUNT(*)"]
+    for key, column in (('temp', 'air_temperature'), ('humidity', 'humidity'), ('pressure', 'barometric_pressure')):
+        aggregates += [f"AVG({column})", f"VAR_POP({column}) * COUNT({column})", f"MIN({column})", f"MAX({column})"]
+    columns = ['station_name', 'bucket_start'] + _state_columns()
+
+    def rebuild():
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {schema_name}.{partition} IN SHARE MODE;")
+                for table, _, unit in ROLLUPS.values():
+                    cursor.execute(f"DELETE FROM {table} WHERE bucket_start >= %s AND bucket_start < %s",
+                                   (start.to_pydatetime(), end.to_pydatetime()))
+                    cursor.execute(f"""
+                        INSERT INTO {table} ({', '.join(columns)})
+                        SELECT station_name, date_trunc('{unit}', measurement_timestamp), {', '.join(aggregates)}
+                        FROM {schema_name}.{partition}
+                        GROUP BY 1, 2
+                    """)
+            conn.commit()
+
+    with timer('rollup_backfill_seconds'):
+        retry_operation(rebuild, file_path=partition)
+    logger.info(f"Rebuilt hourly/daily rollups from partition {partition}.")
+    return partition
+
+
+def backfill_rollups(workers=ROLLUP_BACKFILL_WORKERS):
+    # Rebuilds the rollups from raw data, one monthly partition per task.
+    bootstrap_schema()
+    with db_connection() as conn:
+        partitions = list_raw_partitions(conn)
         conn.commit()
-        logger.info(f"{len(valid_rows)} rows inserted into {aggregated_metrics_table}.")
-    
-    if invalid_rows:
-        logger.warning(f"Skipped {len(invalid_rows)} rows due to primary key violations.")
-    
-    return valid_rows, invalid_rows
+    prefix = f"{TABLES['raw_sensor_data']}_p"
+    partitions = [name for name in partitions if name.startswith(prefix)]
+    if not partitions:
+        logger.info("No raw data partitions to backfill rollups from.")
+        return []
+    # Each task holds a pooled connection, so more workers than connections would only queue.
+    workers = max(1, min(workers, DB_CONFIG['max_connections'], len(partitions)))
+    logger.info(f"Backfilling rollups from {len(partitions)} partitions with {workers} workers.")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rollup-backfill') as executor:
+        rebuilt = list(executor.map(_rebuild_partition_rollups, partitions))
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, '*')", (STATION_UPDATES_CHANNEL,))
+        conn.commit()
+    return rebuilt
+
+
+def _finalize_state(state, key_columns):
+    metrics = state[key_columns + ['row_count', 'updated_at']].copy()
+    for key in STATE_MEASUREMENTS:
+        count = state['row_count'].astype('float64')
+        metrics[f'min_{key}'] = state[f'min_{key}']
+        metrics[f'max_{key}'] = state[f'max_{key}']
+        metrics[f'avg_{key}'] = state[f'mean_{key}']
+        metrics[f'std_{key}'] = (state[f'm2_{key}'].astype('float64') / (count - 1)).where(count > 1) ** 0.5
+    return metrics
+
+
+def _read_state(conn, query, params):
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        columns = [desc[0] for desc in cursor.description]
+        return pd.DataFrame(cursor.fetchall(), columns=columns)
+
+
+def get_station_metrics(conn, station_names=None):
+    query = f"SELECT station_name, {', '.join(_state_columns())}, updated_at FROM {station_metrics_table}"
+    params = None
+    if station_names:
+        query += " WHERE station_name = ANY(%s)"
+        params = (list(station_names),)
+    return _finalize_state(_read_state(conn, query, params), ['station_name'])
+
+
+def get_rollup_metrics(conn, granularity, start, end, station_names=None):
+    # Per-station min/max/avg/std for each hourly or daily bucket in [start, end).
+    table = ROLLUPS[granularity][0]
+    query = f"""
+        SELECT station_name, bucket_start, {', '.join(_state_columns())}, updated_at
+        FROM {table}
+        WHERE bucket_start >= %s AND bucket_start < %s
+    """
+    params = [pd.Timestamp(start).to_pydatetime(), pd.Timestamp(end).to_pydatetime()]
+    if station_names:
+        query += " AND station_name = ANY(%s)"
+        params.append(list(station_names))
+    query += " ORDER BY station_name, bucket_start"
+    return _finalize_state(_read_state(conn, query, params), ['station_name', 'bucket_start'])
+
+
+def get_window_station_metrics(conn, start, end):
+    # Whole-window metrics per station, merged from daily buckets when the window is day-aligned.
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    granularity = 'daily' if start == start.normalize() and end == end.normalize() else 'hourly'
+    state = _read_state(conn, f"""
+        SELECT station_name, {', '.join(_state_columns())}, updated_at
+        FROM {ROLLUPS[granularity][0]}
+        WHERE bucket_start >= %s AND bucket_start < %s
+    """, (start.to_pydatetime(), end.to_pydatetime()))
+    if state.empty:
+        return _finalize_state(state, ['station_name'])
+
+    parts = state.drop(columns='updated_at').rename(columns={'row_count': 'count'})
+    measures = parts.columns.drop('station_name')
+    parts[measures] = parts[measures].astype('float64')
+    combined = combine_partial_metrics(parts, 'station_name').rename(columns={'count': 'row_count'})
+    combined['row_count'] = combined['row_count'].astype('int64')
+    combined['updated_at'] = state.groupby('station_name')['updated_at'].max()
+    return _finalize_state(combined.rename_axis('station_name').reset_index(), ['station_name'])
+
+
+def get_latest_readings(conn, station_names=None):
+    # Newest raw row per known station: one index probe each instead of a scan.
+    query = f"""
+        SELECT r.station_name, r.measurement_timestamp, r.air_temperature, r.humidity,
+               r.barometric_pressure, r.measurement_id
+        FROM {station_metrics_table} s
+        CROSS JOIN LATERAL (
+            SELECT * FROM {raw_sensor_table} raw
+            WHERE raw.station_name = s.station_name
+            ORDER BY raw.measurement_timestamp DESC
+            LIMIT 1
+        ) r
+    """
+    params = None
+    if station_names:
+        query += " WHERE s.station_name = ANY(%s)"
+        params = (list(station_names),)
+    return _read_state(conn, query + " ORDER BY r.station_name", params)
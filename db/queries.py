@@ -0,0 +1,186 @@
+import select
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from config.settings import QUERY_CACHE_TTL, QUERY_CACHE_SIZE
+from db.db_utils import (db_connection, bootstrap_schema, listen_connection, get_station_metrics,
+                         get_rollup_metrics, get_window_station_metrics, get_latest_readings,
+                         ROLLUPS, STATE_MEASUREMENTS, STATION_UPDATES_CHANNEL)
+from db.retry_utils import retry_operation
+from src.logger import get_logger
+from src.metrics import inc, timed
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+logger = get_logger(__name__)
+
+METRIC_NAMES = ['row_count'] + [f'{stat}_{key}' for key in STATE_MEASUREMENTS
+                                for stat in ('min', 'max', 'avg', 'std')]
+
+
+# LRU cache with a TTL. Each entry remembers the stations it covers (None for all of them),
+# so new rows for one station only evict the results that could include it.
+class QueryCache:
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a result computed across one is not cached.
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key, stations, value, generation=None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic(), stations, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, station_names=None):
+        # None drops everything; otherwise entries for all stations or any of these.
+        with self._lock:
+            self.generation += 1
+            if station_names is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                changed = set(station_names)
+                stale = [key for key, (_, stations, _) in self._entries.items()
+                         if stations is None or changed & stations]
+                for key in stale:
+                    del self._entries[key]
+                dropped = len(stale)
+        if dropped:
+            inc('query_cache_invalidated_total', dropped)
+        return dropped
+
+
+query_cache = QueryCache()
+
+
+def _cached(name, station_names, run, *key):
+    stations = frozenset(station_names) if station_names else None
+    cache_key = (name, stations) + key
+    result = query_cache.get(cache_key)
+    if result is not None:
+        inc('query_cache_requests_total', query=name, result='hit')
+        return result
+
+    inc('query_cache_requests_total', query=name, result='miss')
+    generation = query_cache.generation
+
+    def query():
+        bootstrap_schema()
+        with db_connection() as conn:
+            frame = run(conn)
+            conn.commit()
+            return frame
+
+    result = retry_operation(query, file_path=f"Query {name}")
+    query_cache.put(cache_key, stations, result, generation)
+    return result
+
+
+def _output(frame, as_arrow):
+    # Cached frames are shared, so callers get a copy (or an immutable Arrow table).
+    if as_arrow:
+        if pa is None:
+            raise RuntimeError("pyarrow is required for Arrow results")
+        return pa.Table.from_pandas(frame, preserve_index=False)
+    return frame.copy()
+
+
+def _window(start, end):
+    if start is None or end is None:
+        raise ValueError("Both start and end are required for a time window")
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if end <= start:
+        raise ValueError(f"Window end {end} must be after its start {start}")
+    return start, end
+
+
+@timed('query_latest_readings')
+def latest_readings(station_names=None, as_arrow=False):
+    def run(conn):
+        return get_latest_readings(conn, sorted(station_names) if station_names else None)
+
+    return _output(_cached('latest_readings', station_names, run), as_arrow)
+
+
+@timed('query_window_metrics')
+def window_metrics(start, end, granularity='hourly', station_names=None, as_arrow=False):
+    # Per-station min/max/avg/std for each hourly or daily bucket in [start, end).
+    if granularity not in ROLLUPS:
+        raise ValueError(f"Unknown granularity {granularity!r}, expected one of {', '.join(ROLLUPS)}")
+    start, end = _window(start, end)
+
+    def run(conn):
+        return get_rollup_metrics(conn, granularity, start, end, sorted(station_names) if station_names else None)
+
+    return _output(_cached('window_metrics', station_names, run, start, end, granularity), as_arrow)
+
+
+@timed('query_top_stations')
+def top_stations(metric='avg_temp', n=10, start=None, end=None, ascending=False, as_arrow=False):
+    # The n stations with the highest (or lowest) metric, over a window or all time.
+    if metric not in METRIC_NAMES:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {', '.join(METRIC_NAMES)}")
+    if n <= 0:
+        raise ValueError("n must be positive")
+    if start is not None or end is not None:
+        start, end = _window(start, end)
+
+    def run(conn):
+        metrics = get_station_metrics(conn) if start is None else get_window_station_metrics(conn, start, end)
+        metrics = metrics.sort_values(metric, ascending=ascending, na_position='last')
+        return metrics.head(n).reset_index(drop=True)
+
+    return _output(_cached('top_stations', None, run, metric, n, start, end, ascending), as_arrow)
+
+
+def start_invalidation_listener(cache=query_cache, reconnect_delay=5):
+    # LISTENs for committed station updates from any process or host and evicts those stations.
+    # While disconnected notifications are missed, so the whole cache is cleared on reconnect.
+    def run():
+        while True:
+            try:
+                conn = listen_connection(STATION_UPDATES_CHANNEL)
+            except Exception as e:
+                logger.error(f"Query cache listener could not connect: {e}")
+                time.sleep(reconnect_delay)
+                continue
+            cache.invalidate()
+            try:
+                while True:
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        payload = conn.notifies.pop(0).payload
+                        cache.invalidate(None if payload == '*' else payload.split('\n'))
+            except Exception as e:
+                logger.error(f"Query cache listener lost its connection: {e}")
+            finally:
+                conn.close()
+            time.sleep(reconnect_delay)
+
+    thread = threading.Thread(target=run, name='query-cache-listener', daemon=True)
+    thread.start()
+    return thread
@@ -1,25 +1,144 @@
+import random
+import threading
 import time
-import logging
+import psycopg2
+from psycopg2 import pool
+from config.settings import RETRY_DEADLINE, RETRY_MAX_DELAY, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+from src.logger import get_logger
+from src.metrics import inc, observe, set_gauge
 
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
-def retry_operation(func, max_retries=3, delay=2, backoff=2, file_path=None):
+# SQLSTATEs worth retrying: serialization failure, deadlock, lock timeout, too many connections,
+# and server shutdown or startup. Class 08 (connection exceptions) is retried as a whole.
+TRANSIENT_SQLSTATES = {'40001', '40P01', '55P03', '53300', '57P01', '57P02', '57P03'}
+TRANSIENT_SQLSTATE_CLASSES = {'08'}
 
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def is_transient(error):
+    # Bad SQL, constraint violations and data errors fail the same way every time, so only
+    # connection-level and concurrency failures are retried.
+    if isinstance(error, pool.PoolError):
+        return True
+    if isinstance(error, psycopg2.Error):
+        code = error.pgcode
+        if code:
+            return code in TRANSIENT_SQLSTATES or code[:2] in TRANSIENT_SQLSTATE_CLASSES
+        return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+    # CircuitOpenError comes from a nested call that gave up waiting for the database.
+    return isinstance(error, (ConnectionError, TimeoutError, CircuitOpenError))
+
+
+# Shared by every thread of the process. While open, callers wait instead of hammering a
+# database that is down; after reset_timeout one caller probes and the rest wait for its result.
+# Retried operations nest (e.g. bootstrap_schema inside a load), so the probing thread's own
+# nested calls pass through instead of waiting on their own probe.
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT,
+                 name='database'):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_thread = None
+        self._condition = threading.Condition()
+
+    def _set_state(self, state):
+        self.state = state
+        self._probe_thread = threading.get_ident() if state == self.HALF_OPEN else None
+        set_gauge('circuit_breaker_open', 0 if state == self.CLOSED else 1, breaker=self.name)
+
+    def wait_until_closed(self, deadline):
+        with self._condition:
+            while True:
+                if self.state == self.CLOSED:
+                    return
+                if self.state == self.HALF_OPEN and self._probe_thread == threading.get_ident():
+                    return
+                now = time.monotonic()
+                if self.state == self.OPEN and now >= self._opened_at + self.reset_timeout:
+                    self._set_state(self.HALF_OPEN)
+                    logger.info(f"Circuit breaker '{self.name}' half-open, letting one probe through.")
+                    return
+                if now >= deadline:
+                    raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+                if self.state == self.OPEN:
+                    wait = self._opened_at + self.reset_timeout - now
+                else:
+                    wait = deadline - now
+                self._condition.wait(timeout=min(wait, deadline - now))
+
+    def record_success(self):
+        with self._condition:
+            self._failures = 0
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+                logger.info(f"Circuit breaker '{self.name}' closed.")
+                self._condition.notify_all()
+
+    def record_failure(self):
+        with self._condition:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+                inc('circuit_breaker_opened_total', breaker=self.name)
+                logger.error(f"Circuit breaker '{self.name}' opened after {self._failures} consecutive failures; "
+                             f"pausing for {self.reset_timeout} seconds.")
+                self._condition.notify_all()
+
+
+db_breaker = CircuitBreaker()
+
+
+def retry_operation(func, max_retries=3, delay=2, backoff=2, file_path=None, deadline=RETRY_DEADLINE,
+                    breaker=db_breaker):
+
+    operation = func.__name__
+    deadline_at = time.monotonic() + deadline
     attempts = 0
-    while attempts < max_retries:
+    while True:
+        if breaker is not None:
+            breaker.wait_until_closed(deadline_at)
         try:
-            return func()  # This will run the file processing or DB operations
+            result = func()  # This will run the file processing or DB operations
         except Exception as e:
             attempts += 1
-            logger.error(f"Attempt {attempts} failed for {func.__name__} with file {file_path}: {e}")
-            if attempts >= max_retries:
-                logger.error(f"Max retries reached for {func.__name__} with file {file_path}. Operation failed.")
-                if func.__name__ == "file_processing":
-                    raise  # File processing should raise error after max retries
+            transient = is_transient(e)
+            if breaker is not None:
+                if transient:
+                    breaker.record_failure()
                 else:
-                    # If DB operation failed, do not retry the file processing, raise the error
-                    raise  
-            # Exponential backoff
-            sleep_time = delay * (backoff ** (attempts - 1))
-            logger.info(f"Retrying {func.__name__} for file {file_path} in {sleep_time} seconds...")
+                    # A permanent error still proves the database answered, so a half-open
+                    # probe that hits one must close the breaker rather than leave it half-open.
+                    breaker.record_success()
+            inc('retry_attempts_failed_total', operation=operation, kind='transient' if transient else 'permanent')
+            logger.error(f"Attempt {attempts} failed for {operation} with file {file_path}: {e}")
+            if not transient:
+                logger.error(f"Permanent error in {operation} with file {file_path}, not retrying.")
+                raise
+            if attempts >= max_retries:
+                inc('retry_exhausted_total', operation=operation)
+                logger.error(f"Max retries reached for {operation} with file {file_path}. Operation failed.")
+                raise
+            # Full jitter keeps parallel workers from retrying in lockstep.
+            sleep_time = random.uniform(0, min(RETRY_MAX_DELAY, delay * (backoff ** (attempts - 1))))
+            if time.monotonic() + sleep_time > deadline_at:
+                inc('retry_exhausted_total', operation=operation)
+                logger.error(f"Retry deadline of {deadline}s reached for {operation} with file {file_path}.")
+                raise
+            logger.info(f"Retrying {operation} for file {file_path} in {sleep_time:.2f} seconds...")
+            observe('retry_backoff_seconds', sleep_time, operation=operation)
             time.sleep(sleep_time)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
@@ -0,0 +1,117 @@
+from psycopg2.extras import execute_values
+from config.settings import WORK_QUEUE_LEASE_SECONDS, WORK_QUEUE_MAX_ATTEMPTS
+from db.db_utils import file_queue_table
+from src.logger import get_logger
+from src.metrics import inc
+
+logger = get_logger(__name__)
+
+QUEUE_STATUSES = ['pending', 'processing', 'done', 'failed']
+
+
+def enqueue_files(conn, entries):
+    # entries are (file_name, size, mtime_ns, wait_for_ready). Registering a file twice is a
+    # no-op; a finished file whose size or mtime has changed since is queued again.
+    if not entries:
+        return 0
+    with conn.cursor() as cursor:
+        rows = execute_values(cursor, f"""
+            INSERT INTO {file_queue_table} AS q (file_name, size, mtime_ns, wait_for_ready)
+            VALUES %s
+            ON CONFLICT (file_name) DO UPDATE SET
+                size = EXCLUDED.size, mtime_ns = EXCLUDED.mtime_ns,
+                wait_for_ready = EXCLUDED.wait_for_ready, status = 'pending', attempts = 0,
+                worker_id = NULL, lease_expires_at = NULL, enqueued_at = NOW(),
+                started_at = NULL, finished_at = NULL, last_error = NULL
+            WHERE q.status IN ('done', 'failed')
+              AND (q.size, q.mtime_ns) IS DISTINCT FROM (EXCLUDED.size, EXCLUDED.mtime_ns)
+            RETURNING file_name
+        """, list(entries), fetch=True)
+    conn.commit()
+    inc('work_queue_enqueued_total', len(rows))
+    return len(rows)
+
+
+def claim_files(conn, worker_id, limit=1, lease_seconds=WORK_QUEUE_LEASE_SECONDS,
+                max_attempts=WORK_QUEUE_MAX_ATTEMPTS):
+    # Leases up to limit pending files, or files whose previous worker stopped renewing its
+    # lease, oldest first. SKIP LOCKED lets concurrent claimers pass over each other's rows.
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {file_queue_table}
+            SET status = 'failed', finished_at = NOW(), worker_id = NULL, lease_expires_at = NULL,
+                last_error = COALESCE(last_error, 'Lease expired') || ' (gave up after ' || attempts || ' attempts)'
+            WHERE status = 'processing' AND lease_expires_at < NOW() AND attempts >= %s
+        """, (max_attempts,))
+        abandoned = cursor.rowcount
+        cursor.execute(f"""
+            UPDATE {file_queue_table} q
+            SET status = 'processing', worker_id = %s, attempts = q.attempts + 1,
+                lease_expires_at = NOW() + make_interval(secs => %s), started_at = NOW()
+            FROM (
+                SELECT file_name FROM {file_queue_table}
+                WHERE status = 'pending'
+                   OR (status = 'processing' AND lease_expires_at < NOW())
+                ORDER BY enqueued_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ) claimable
+            WHERE q.file_name = claimable.file_name
+            RETURNING q.file_name, q.wait_for_ready, q.attempts
+        """, (worker_id, lease_seconds, limit))
+        claimed = cursor.fetchall()
+    conn.commit()
+    if abandoned:
+        inc('work_queue_files_total', abandoned, result='abandoned')
+        logger.warning(f"Marked {abandoned} queued files as failed after {max_attempts} expired leases.")
+    return claimed
+
+
+def renew_leases(conn, worker_id, lease_seconds=WORK_QUEUE_LEASE_SECONDS):
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {file_queue_table}
+            SET lease_expires_at = NOW() + make_interval(secs => %s)
+            WHERE worker_id = %s AND status = 'processing'
+        """, (lease_seconds, worker_id))
+        renewed = cursor.rowcount
+    conn.commit()
+    return renewed
+
+
+def finish_file(conn, worker_id, file_name, signature=None, error=None, max_attempts=WORK_QUEUE_MAX_ATTEMPTS):
+    # Only the current lease holder may finish a file; returns False if the lease was lost.
+    # A failure goes back to pending until it has used up max_attempts.
+    with conn.cursor() as cursor:
+        if error is None:
+            size, mtime_ns = signature if signature is not None else (None, None)
+            cursor.execute(f"""
+                UPDATE {file_queue_table}
+                SET status = 'done', finished_at = NOW(), lease_expires_at = NULL, last_error = NULL,
+                    size = COALESCE(%s, size), mtime_ns = COALESCE(%s, mtime_ns)
+                WHERE file_name = %s AND worker_id = %s AND status = 'processing'
+            """, (size, mtime_ns, file_name, worker_id))
+        else:
+            cursor.execute(f"""
+                UPDATE {file_queue_table}
+                SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                    finished_at = NOW(), lease_expires_at = NULL, worker_id = NULL, last_error = %s
+                WHERE file_name = %s AND worker_id = %s AND status = 'processing'
+            """, (max_attempts, str(error), file_name, worker_id))
+        owned = cursor.rowcount == 1
+    conn.commit()
+    if not owned:
+        # The worker now holding the lease reports the outcome.
+        inc('work_queue_files_total', result='lease_lost')
+        logger.warning(f"Lease on queued file {file_name} was lost before {worker_id} finished it.")
+        return False
+    inc('work_queue_files_total', result='failed' if error is not None else 'done')
+    return True
+
+
+def queue_status(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT status, COUNT(*) FROM {file_queue_table} GROUP BY status")
+        counts = dict(cursor.fetchall())
+    conn.commit()
+    return {status: counts.get(status, 0) for status in QUEUE_STATUSES}
@@ -1,12 +1,44 @@
 from src.monitor import monitor_directory
-from config.settings import  DATA_DIR
+from config.settings import  DATA_DIR, RAW_PARTITION_RETENTION_MONTHS, RAW_PARTITION_DROP
 from src.logger import get_logger
+from db.db_utils import bootstrap_schema, db_connection, detach_partitions_older_than, backfill_rollups
+from db.work_queue import queue_status
+import argparse
 import os
 logger = get_logger(__name__)
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Beach weather station ingestion pipeline.")
+    parser.add_argument('--backfill-rollups', action='store_true',
+                        help="Rebuild the hourly/daily rollup tables from raw data and exit.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Parallel partitions for --backfill-rollups (default: ROLLUP_BACKFILL_WORKERS).")
+    parser.add_argument('--queue-status', action='store_true',
+                        help="Print file counts per status in the shared work queue and exit.")
+    args = parser.parse_args()
+    if args.queue_status:
+        bootstrap_schema()
+        with db_connection() as conn:
+            for status, count in queue_status(conn).items():
+                print(f"{status}: {count}")
+        raise SystemExit(0)
+    if args.backfill_rollups:
+        try:
+            backfill_rollups(**({'workers': args.workers} if args.workers else {}))
+        except Exception as e:
+            logger.critical(f"Rollup backfill failed: {e}", exc_info=True)
+            raise SystemExit(1)
+        raise SystemExit(0)
     try:
         logger.info("Starting the file monitoring pipeline.")
         os.makedirs(DATA_DIR, exist_ok=True) 
+        try:
+            bootstrap_schema()
+            if RAW_PARTITION_RETENTION_MONTHS:
+                with db_connection() as conn:
+                    detach_partitions_older_than(conn, RAW_PARTITION_RETENTION_MONTHS, drop=RAW_PARTITION_DROP)
+        except Exception as e:
+            # Workers bootstrap lazily on their first load, so a database outage does not block startup.
+            logger.error(f"Schema bootstrap failed at startup, will retry on first load: {e}")
         monitor_directory(DATA_DIR)
     except Exception as e:
-        logger.critical(f"Critical error in pipeline: {e}", exc_info=True)
\ No newline at end of file
+        logger.critical(f"Critical error in pipeline: {e}", exc_info=True)
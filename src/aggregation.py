@@ -1,29 +1,115 @@
 import os
+import numpy as np
+import pandas as pd
 from src.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Per-row origin of a micro-batch that combines several files.
+SOURCE_FILE_COLUMN = 'Source File'
+
+MEASUREMENT_COLUMNS = {
+    'temp': 'Air Temperature',
+    'humidity': 'Humidity',
+    'pressure': 'Barometric Pressure',
+}
+
+
+def calculate_partial_metrics(df, keys='Station Name'):
+    # Mergeable per-station state: row count plus mean, M2 (sum of squared deviations), min and max.
+    grouped = df.groupby(keys, observed=True)
+    state = pd.DataFrame({'count': grouped.size()})
+    for key, column in MEASUREMENT_COLUMNS.items():
+        values = grouped[column]
+        state[f'mean_{key}'] = values.mean()
+        state[f'm2_{key}'] = values.var(ddof=0) * state['count']
+        state[f'min_{key}'] = values.min()
+        state[f'max_{key}'] = values.max()
+    return state
+
+
+def calculate_bucket_metrics(df, freq):
+    # Same state per station and time bucket ('h' or 'D'), indexed by (Station Name, Bucket Start).
+    bucket = df['Measurement Timestamp'].dt.floor(freq).rename('Bucket Start')
+    return calculate_partial_metrics(df, keys=[df['Station Name'], bucket])
+
+
+def merge_partial_metrics(left, right):
+    # Chan et al. pairwise update, so chunks can be combined in any order.
+    if left is None or left.empty:
+        return right
+    if right is None or right.empty:
+        return left
+
+    stations = left.index.union(right.index)
+    a = left.reindex(stations)
+    b = right.reindex(stations)
+    na = a['count'].fillna(0)
+    nb = b['count'].fillna(0)
+    n = na + nb
+
+    merged = pd.DataFrame({'count': n.astype('int64')}, index=stations)
+    for key in MEASUREMENT_COLUMNS:
+        mean_a = a[f'mean_{key}'].fillna(0)
+        mean_b = b[f'mean_{key}'].fillna(0)
+        delta = mean_b - mean_a
+        merged[f'mean_{key}'] = mean_a + delta * nb / n
+        merged[f'm2_{key}'] = (a[f'm2_{key}'].fillna(0) + b[f'm2_{key}'].fillna(0)
+                               + delta ** 2 * na * nb / n)
+        merged[f'min_{key}'] = np.fmin(a[f'min_{key}'], b[f'min_{key}'])
+        merged[f'max_{key}'] = np.fmax(a[f'max_{key}'], b[f'max_{key}'])
+    return merged
+
+
+def combine_partial_metrics(state, key):
+    # Vectorised form of merge_partial_metrics for many rows per key, e.g. the time buckets
+    # of each station: counts add up and M2 picks up each part's deviation from the combined mean.
+    groups = state[key]
+    count = state.groupby(key, observed=True)['count'].sum()
+    combined = pd.DataFrame({'count': count})
+    for name in MEASUREMENT_COLUMNS:
+        mean = (state['count'] * state[f'mean_{name}']).groupby(groups, observed=True).sum() / count
+        deviation = state[f'mean_{name}'] - groups.map(mean)
+        combined[f'mean_{name}'] = mean
+        combined[f'm2_{name}'] = (state[f'm2_{name}'] + state['count'] * deviation ** 2).groupby(groups, observed=True).sum()
+        combined[f'min_{name}'] = state.groupby(key, observed=True)[f'min_{name}'].min()
+        combined[f'max_{name}'] = state.groupby(key, observed=True)[f'max_{name}'].max()
+    return combined
+
+
+def finalize_metrics(state, file_path):
+    metrics = pd.DataFrame({
+        'Source File': os.path.basename(file_path),
+        'Station Name': state.index,
+    })
+    count = state['count'].to_numpy()
+    for key in MEASUREMENT_COLUMNS:
+        m2 = state[f'm2_{key}'].to_numpy()
+        metrics[f'min_{key}'] = state[f'min_{key}'].to_numpy()
+        metrics[f'max_{key}'] = state[f'max_{key}'].to_numpy()
+        metrics[f'avg_{key}'] = state[f'mean_{key}'].to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            metrics[f'std_{key}'] = np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+    return metrics[['Source File', 'Station Name',
+                    'min_temp', 'max_temp', 'avg_temp', 'std_temp',
+                    'min_humidity', 'max_humidity', 'avg_humidity', 'std_humidity',
+                    'min_pressure', 'max_pressure', 'avg_pressure', 'std_pressure']]
+
+
+def calculate_metrics_by_file(df):
+    # One set of per-station metrics for each Source File in the frame.
+    frames = [finalize_metrics(calculate_partial_metrics(group), source)
+              for source, group in df.groupby(SOURCE_FILE_COLUMN, sort=False)]
+    if not frames:
+        return finalize_metrics(calculate_partial_metrics(df), '')
+    return pd.concat(frames, ignore_index=True)
+
+
 def calculate_aggregated_metrics(df,file_path):
 
+    metrics = finalize_metrics(calculate_partial_metrics(df), file_path)
 
-    df['Source File'] = os.path.basename(file_path)
-    
-    metrics = df.groupby(['Source File', 'Station Name']).agg(
-        min_temp=('Air Temperature', 'min'),
-        max_temp=('Air Temperature', 'max'),
-        avg_temp=('Air Temperature', 'mean'),
-        std_temp=('Air Temperature', 'std'),
-        min_humidity=('Humidity', 'min'),
-        max_humidity=('Humidity', 'max'),
-        avg_humidity=('Humidity', 'mean'),
-        std_humidity=('Humidity', 'std'),
-        min_pressure=('Barometric Pressure', 'min'),
-        max_pressure=('Barometric Pressure', 'max'),
-        avg_pressure=('Barometric Pressure', 'mean'),
-        std_pressure=('Barometric Pressure', 'std')
-    ).reset_index()
-    
     logger.info(f'Aggregation completed for file: {file_path}')
-    
-    
+
+
     return metrics
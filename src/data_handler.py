@@ -1,18 +1,87 @@
-from src.data_processor import validate_and_transform
+from src.data_processor import validate_and_transform, validate_and_transform_batch
 from src.logger import get_logger
 from src.file_utils import log_error
+from src.ledger import get_ledger, content_hash
+from src.readiness import wait_until_stable, wait_until_all_stable, file_signature
+from config.settings import MICRO_BATCH_MAX_FILE_BYTES
 
 logger = get_logger(__name__)
 
-def process_file(file_path):
-    
+
+def _pending_file(file_path, wait_for_ready):
+    # Returns (signature, digest) for a file that still has to be loaded, or None if the
+    # ledger already has it under this name or as a byte-identical copy.
+    if wait_for_ready and not wait_until_stable(file_path):
+        raise RuntimeError("File was not complete within the readiness timeout")
+
+    ledger = get_ledger()
+    signature = file_signature(file_path)
+    if signature is None:
+        raise FileNotFoundError(file_path)
+    if ledger.is_processed(file_path, signature):
+        logger.info(f"File already processed, skipping: {file_path}")
+        return None
+    digest = content_hash(file_path)
+    original = ledger.find_by_hash(digest)
+    if original is not None:
+        logger.info(f"File {file_path} has the same content as already processed {original}, skipping.")
+        ledger.record(file_path, signature, digest)
+        return None
+    return signature, digest
+
+
+def process_file(file_path, wait_for_ready=False, raise_errors=False):
+    # raise_errors hands the failure to a caller that tracks per-file status, such as a queue worker.
     logger.info(f"Processing file: {file_path}")
     try:
+        pending = _pending_file(file_path, wait_for_ready)
+        if pending is None:
+            return
+
         validate_and_transform(file_path)
+        get_ledger().record(file_path, *pending)
 
     except Exception as e:
         logger.error(f"Error processing file {file_path}: {e}")
         log_error(file_path, str(e))  
+        if raise_errors:
+            raise
     finally:
         logger.info(f"Waithing for new File")
-      
+
+
+def process_batch(files):
+    # files is a list of (file_path, wait_for_ready). Small files share load transactions;
+    # files that grew past the micro-batch size since submission are processed on their own.
+    logger.info(f"Processing micro-batch of {len(files)} files.")
+    pending = {}
+    large = []
+    unsettled = [file_path for file_path, wait_for_ready in files if wait_for_ready]
+    ready = wait_until_all_stable(unsettled) if unsettled else set()
+    for file_path, wait_for_ready in files:
+        try:
+            if wait_for_ready and file_path not in ready:
+                raise RuntimeError("File was not complete within the readiness timeout")
+            state = _pending_file(file_path, False)
+        except Exception as e:
+            logger.error(f"Error processing file {file_path}: {e}")
+            log_error(file_path, str(e))
+            continue
+        if state is None:
+            continue
+        if state[0][0] > MICRO_BATCH_MAX_FILE_BYTES:
+            large.append(file_path)
+        else:
+            pending[file_path] = state
+
+    try:
+        for loaded in validate_and_transform_batch(list(pending)):
+            for file_path in loaded:
+                get_ledger().record(file_path, *pending.pop(file_path))
+    except Exception as e:
+        # One bad file must not hold back the others: retry what is left one file at a time.
+        logger.error(f"Micro-batch load failed, processing {len(pending)} files individually: {e}")
+        large.extend(pending)
+
+    for file_path in large:
+        process_file(file_path)
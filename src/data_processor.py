@@ -1,60 +1,161 @@
-from src.validation import check_missing_values, validate_numeric_columns, validate_timestamp_format
-from src.aggregation import calculate_aggregated_metrics
-from src.file_utils import save_valid_data, save_failed_rows
+from src.validation import validate_dataframe
+from src.aggregation import calculate_partial_metrics, merge_partial_metrics, finalize_metrics, SOURCE_FILE_COLUMN
+from src.file_utils import save_valid_data, save_failed_rows, save_aggregated_data
 from src.logger import get_logger
+from src.metrics import timed, inc
+from src.readiness import wait_until_stable
+from src.reader import read_sensor_csv, iter_sensor_csv
+from src.pipeline import overlapped
+from src.dedup import SortedKeys, hash_ids
+import itertools
+import os
 import pandas as pd
-from config.settings import CRITICAL_COLUMNS
-import time
+from config.settings import CHUNK_SIZE, PIPELINE_OVERLAP, MICRO_BATCH_ROWS
 logger = get_logger(__name__)
 
-def validate_and_transform(file_path):
-
-    def read_file_with_retry():
-        attempts = 0
-        while attempts < 3:  
-            try:
-                logger.info(f"Starting to process the file: {file_path}")
-                time.sleep(500/10000)
-                df = pd.read_csv(file_path, usecols=CRITICAL_COLUMNS)
-                if df is None or df.empty:
-                    logger.warning(f"The file {file_path} contains no data.")
-                    save_failed_rows(pd.DataFrame([]), ["File is empty"], file_path)
-                    return None
-                return df
-            except Exception as e:
-                attempts += 1
-                logger.error(f"Error reading file {file_path} on attempt {attempts}: {e}")
-                if attempts >= 3:  
-                    logger.error(f"Max retries reached for reading file {file_path}. Skipping the file.")
-                    save_failed_rows(pd.DataFrame([]), [str(e)], file_path)
-                    return None
-                logger.info(f"Retrying reading file {file_path} in 2 seconds...")
-                time.sleep(2) 
-                
-    df = read_file_with_retry()
+
+def read_file_with_retry(file_path, chunksize=None):
+    attempts = 0
+    while attempts < 3:  
+        try:
+            logger.info(f"Starting to process the file: {file_path}")
+            if chunksize:
+                return iter_sensor_csv(file_path, chunksize)
+            df = read_sensor_csv(file_path)
+            if df is None or df.empty:
+                logger.warning(f"The file {file_path} contains no data.")
+                save_failed_rows(pd.DataFrame([]), ["File is empty"], file_path)
+                return None
+            return df
+        except Exception as e:
+            attempts += 1
+            logger.error(f"Error reading file {file_path} on attempt {attempts}: {e}")
+            # An empty file or missing columns fails the same way on every attempt; only
+            # tokenizing errors, such as a half-written last line, are worth waiting out.
+            malformed = isinstance(e, ValueError) and not isinstance(e, pd.errors.ParserError)
+            if malformed or attempts >= 3:
+                logger.error(f"Giving up on reading file {file_path}. Skipping the file.")
+                save_failed_rows(pd.DataFrame([]), [str(e)], file_path)
+                return None
+            # A read usually fails because the producer is still writing; retry once the file settles.
+            logger.info(f"Retrying reading file {file_path} once it stops changing...")
+            wait_until_stable(file_path)
+
+
+def _record_validation(raw_rows, valid_df, failed_df):
+    inc('pipeline_rows_total', raw_rows, stage='read')
+    inc('pipeline_rows_total', 0 if valid_df is None else len(valid_df), stage='valid')
+    inc('pipeline_rows_total', len(failed_df), stage='quarantined')
+
+
+@timed('validate_and_transform')
+def validate_and_transform(file_path, chunksize=CHUNK_SIZE):
+    if chunksize:
+        return validate_and_transform_chunked(file_path, chunksize)
+
+    df = read_file_with_retry(file_path)
     if df is None:
         return None  
 
-    failed_rows, reasons = [], []
-
-    df, failed_rows, reasons = check_missing_values(df, failed_rows, reasons, logger)
+    raw_rows = len(df)
+    df, failed_df = validate_dataframe(df, logger)
+    _record_validation(raw_rows, df, failed_df)
+    save_failed_rows(failed_df, None, file_path)
     if df is None or df.empty:
-        logger.warning(f"No valid rows after performing check for missing values for file {file_path}.")
-        save_failed_rows(pd.DataFrame(failed_rows), reasons, file_path)
+        logger.warning(f"No valid rows after validation for file {file_path}.")
         return None
 
+    save_valid_data(df,file_path)
 
-    df, failed_rows, reasons = validate_numeric_columns(df, failed_rows, reasons, logger)
-    if df is None or df.empty:
-        logger.warning(f"No valid rows after performing checks for data types for file {file_path}.")
-        save_failed_rows(pd.DataFrame(failed_rows), reasons, file_path)
+    logger.info(f"Processing complete for file: {file_path}")
+
+
+def validate_and_transform_chunked(file_path, chunksize, overlap=PIPELINE_OVERLAP):
+    # Streams the file so peak memory is bounded by chunksize rather than file size.
+    reader = read_file_with_retry(file_path, chunksize=chunksize)
+    if reader is None:
         return None
 
-    df, failed_rows, reasons = validate_timestamp_format(df, failed_rows, reasons, logger)
-    save_failed_rows(pd.DataFrame(failed_rows), reasons, file_path)
+    parts = itertools.count()
 
+    def prepare(chunk):
+        # Parse-side work for one chunk: validation and its quarantine output.
+        if chunk.empty:
+            return 0, None
+        valid_df, failed_df = validate_dataframe(chunk, logger)
+        _record_validation(len(chunk), valid_df, failed_df)
+        save_failed_rows(failed_df, None, file_path, part=next(parts))
+        return len(chunk), valid_df
 
-    save_valid_data(df,file_path)
+    prepared = overlapped(reader, prepare) if overlap else map(prepare, reader)
 
-    logger.info(f"Processing complete for file: {file_path}")
-    
\ No newline at end of file
+    state = None
+    # Hashes of the IDs already counted, so a row repeated in a later chunk counts once.
+    seen_ids = SortedKeys()
+    chunks = 0
+    total_rows = 0
+    for rows, valid_df in prepared:
+        if not rows:
+            continue
+        total_rows += rows
+        chunks += 1
+        if valid_df is None or valid_df.empty:
+            continue
+        save_valid_data(valid_df, file_path, aggregate=False)
+        # The file's metrics include rows that an earlier attempt already loaded.
+        valid_df = valid_df[~valid_df['Measurement ID'].duplicated()]
+        keys = hash_ids(valid_df['Measurement ID'])
+        unseen = ~seen_ids.contains(keys)
+        seen_ids.add(keys[unseen])
+        state = merge_partial_metrics(state, calculate_partial_metrics(valid_df[unseen]))
+        logger.info(f"Processed chunk {chunks} ({total_rows} rows so far) of file: {file_path}")
+
+    if chunks == 0:
+        logger.warning(f"The file {file_path} contains no data.")
+        save_failed_rows(pd.DataFrame([]), ["File is empty"], file_path)
+        return None
+
+    if state is None:
+        logger.warning(f"No valid rows after validation for file {file_path}.")
+        return None
+
+    save_aggregated_data(finalize_metrics(state, file_path))
+    logger.info(f"Processing complete for file: {file_path} ({chunks} chunks, {total_rows} rows)")
+
+
+@timed('validate_and_transform_batch')
+def _load_batch(group):
+    # group is a list of (file_path, df); df is None for files already quarantined as unreadable.
+    paths = [file_path for file_path, _ in group]
+    frames = [df.assign(**{SOURCE_FILE_COLUMN: os.path.basename(file_path)}) for file_path, df in group if df is not None]
+    if not frames:
+        return paths
+
+    batch = pd.concat(frames, ignore_index=True)
+    valid_df, failed_df = validate_dataframe(batch, logger)
+    _record_validation(len(batch), valid_df, failed_df)
+    sources = {os.path.basename(file_path): file_path for file_path in paths}
+    for source, failed in failed_df.groupby(SOURCE_FILE_COLUMN, sort=False):
+        save_failed_rows(failed.drop(columns=SOURCE_FILE_COLUMN), None, sources[source])
+
+    if valid_df is not None and not valid_df.empty:
+        save_valid_data(valid_df, None)
+    logger.info(f"Loaded micro-batch of {len(paths)} files ({len(batch)} rows).")
+    return paths
+
+
+def validate_and_transform_batch(file_paths, max_rows=MICRO_BATCH_ROWS):
+    # Small files are read into groups of about max_rows rows; each group is validated as one
+    # frame and loaded in one transaction. Yields each group's paths once it is committed.
+    group = []
+    rows = 0
+    for file_path in file_paths:
+        df = read_file_with_retry(file_path)
+        group.append((file_path, df))
+        rows += 0 if df is None else len(df)
+        if rows >= max_rows:
+            yield _load_batch(group)
+            group = []
+            rows = 0
+    if group:
+        yield _load_batch(group)
@@ -0,0 +1,189 @@
+import threading
+import numpy as np
+import pandas as pd
+from config.settings import DEDUP_INDEX, DEDUP_WARM_MONTHS, DEDUP_MAX_KEYS
+from db.db_utils import bootstrap_schema, db_connection, iter_measurement_ids
+from src.logger import get_logger
+from src.metrics import inc, set_gauge, timed
+
+logger = get_logger(__name__)
+
+# New keys collect in a small sorted delta that is merged into the base array once it
+# grows past this fraction of it, so inserts stay amortised O(n) without re-sorting.
+DELTA_MERGE_RATIO = 0.125
+
+
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+
+
+def hash_ids(ids):
+    # 64-bit FNV-1a over the fixed-width bytes of each ID, one byte column at a time, so the
+    # loop runs over the ID length rather than the row count. NUL padding leaves hashes unchanged
+    # across batches of different widths.
+    values = pd.Series(ids, copy=False).to_numpy(dtype=object)
+    try:
+        raw = np.asarray(values, dtype=bytes)
+    except UnicodeEncodeError:
+        raw = np.asarray([value.encode('utf-8') for value in values], dtype=bytes)
+    if raw.dtype.itemsize == 0 or not len(raw):
+        return np.zeros(len(raw), dtype=np.uint64)
+    columns = raw.view(np.uint8).reshape(len(raw), raw.dtype.itemsize)
+    hashes = np.full(len(raw), FNV_OFFSET, dtype=np.uint64)
+    for position in range(columns.shape[1]):
+        byte = columns[:, position]
+        # Padding bytes past the end of shorter IDs must not change their hash.
+        mixed = (hashes ^ byte) * FNV_PRIME
+        hashes = np.where(byte != 0, mixed, hashes)
+    return hashes
+
+
+class SortedKeys:
+    def __init__(self):
+        self.base = np.empty(0, dtype=np.uint64)
+        self.delta = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.base) + len(self.delta)
+
+    @staticmethod
+    def _member(keys, values):
+        if not len(keys):
+            return np.zeros(len(values), dtype=bool)
+        positions = np.searchsorted(keys, values).clip(max=len(keys) - 1)
+        return keys[positions] == values
+
+    def contains(self, values):
+        return self._member(self.base, values) | self._member(self.delta, values)
+
+    def add(self, values):
+        self.delta = np.union1d(self.delta, values)
+        if len(self.delta) > max(1024, DELTA_MERGE_RATIO * len(self.base)):
+            self.base = np.union1d(self.base, self.delta)
+            self.delta = np.empty(0, dtype=np.uint64)
+
+
+def _month_number(timestamp):
+    return timestamp.year * 12 + timestamp.month - 1
+
+
+def _buckets(stations, timestamps):
+    # Row positions per (measurement month, station).
+    months = pd.to_datetime(pd.Series(timestamps, copy=False))
+    keys = pd.DataFrame({'month': _month_number(months.dt).to_numpy(),
+                         'station': pd.Series(stations, copy=False).to_numpy()})
+    return keys.groupby(['month', 'station'], sort=False, observed=True).indices
+
+
+# Sorted arrays of hashed measurement IDs (8 bytes per row) per measurement month and station.
+# It is a fast pre-filter, not the source of truth: only rows committed by this process or read
+# back from the database are added, and rows it does not know still meet ON CONFLICT in SQL.
+# Months before the warm window are dropped as time moves on, and the oldest months go first
+# once max_keys is exceeded, so memory stays bounded on large tables.
+class MeasurementIndex:
+    def __init__(self, months=DEDUP_WARM_MONTHS, max_keys=DEDUP_MAX_KEYS):
+        self.months = months
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(keys) for keys in self._buckets.values())
+
+    def window_start(self):
+        # First month of the window, or None when every month is kept.
+        if not self.months:
+            return None
+        return (pd.Timestamp.now().to_period('M') - (self.months - 1)).to_timestamp()
+
+    def _evict(self, first_month):
+        if first_month is not None:
+            for bucket in [bucket for bucket in self._buckets if bucket[0] < first_month]:
+                del self._buckets[bucket]
+        if self.max_keys:
+            total = sum(len(keys) for keys in self._buckets.values())
+            for bucket in sorted(self._buckets, key=lambda bucket: bucket[0]):
+                if total <= self.max_keys:
+                    break
+                total -= len(self._buckets.pop(bucket))
+                inc('dedup_index_evicted_total')
+
+    def add(self, stations, timestamps, ids):
+        keys = hash_ids(ids)
+        start = self.window_start()
+        first_month = None if start is None else _month_number(start)
+        with self._lock:
+            for bucket, positions in _buckets(stations, timestamps).items():
+                if first_month is None or bucket[0] >= first_month:
+                    self._buckets.setdefault(bucket, SortedKeys()).add(keys[positions])
+            self._evict(first_month)
+        set_gauge('dedup_index_keys', len(self))
+
+    def contains(self, stations, timestamps, ids):
+        keys = hash_ids(ids)
+        known = np.zeros(len(keys), dtype=bool)
+        with self._lock:
+            for bucket, positions in _buckets(stations, timestamps).items():
+                bucket_keys = self._buckets.get(bucket)
+                if bucket_keys is not None:
+                    known[positions] = bucket_keys.contains(keys[positions])
+        return known
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _warm(index):
+    since = index.window_start()
+    bootstrap_schema()
+    with db_connection() as conn:
+        for batch in iter_measurement_ids(conn, since=since):
+            index.add(batch['station_name'], batch['measurement_timestamp'], batch['measurement_id'])
+        conn.commit()
+    logger.info(f"Dedup index warmed with {len(index)} measurement IDs"
+                f"{f' since {since:%Y-%m-%d}' if since is not None else ''}.")
+
+
+def get_dedup_index():
+    # One index per process, warmed from the database on first use; worker processes call it
+    # at startup so the scan does not delay their first file. If warming fails the index
+    # starts empty; that only costs speed, since the database still rejects duplicates.
+    global _index
+    if not DEDUP_INDEX:
+        return None
+    with _index_lock:
+        if _index is None:
+            index = MeasurementIndex()
+            try:
+                _warm(index)
+            except Exception as e:
+                logger.error(f"Could not warm dedup index, starting empty: {e}")
+                index = MeasurementIndex()
+            _index = index
+        return _index
+
+
+@timed('dedup_filter')
+def filter_known_rows(df):
+    # Drops rows whose measurement ID repeats earlier in the batch or is already loaded.
+    index = get_dedup_index()
+    if index is None or df.empty:
+        return df
+    in_batch = df['Measurement ID'].duplicated().to_numpy()
+    known = index.contains(df['Station Name'], df['Measurement Timestamp'], df['Measurement ID']) & ~in_batch
+    if in_batch.any() or known.any():
+        inc('dedup_rows_skipped_total', int(in_batch.sum()), reason='in_batch')
+        inc('dedup_rows_skipped_total', int(known.sum()), reason='known')
+        logger.info(f"Dedup index skipped {int(known.sum())} already loaded and "
+                    f"{int(in_batch.sum())} repeated rows out of {len(df)}.")
+        return df[~(in_batch | known)]
+    return df
+
+
+def remember_rows(df):
+    # Call only after the rows are committed, or a rolled-back row would be skipped later.
+    index = get_dedup_index()
+    if index is not None and not df.empty:
+        index.add(df['Station Name'], df['Measurement Timestamp'], df['Measurement ID'])
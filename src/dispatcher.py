@@ -0,0 +1,155 @@
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from config.settings import (WORKER_MODE, MAX_WORKERS, MAX_PENDING_FILES, MICRO_BATCH_MAX_FILES,
+                             MICRO_BATCH_LATENCY, MICRO_BATCH_MAX_FILE_BYTES)
+from src.data_handler import process_file, process_batch
+from src.dedup import get_dedup_index
+from src.file_utils import log_error
+from src.logger import get_logger, attach_to_queue, worker_log_queue
+from src.metrics import set_gauge, inc, start_worker_metrics
+
+logger = get_logger(__name__)
+
+
+def _init_worker_process(log_queue):
+    # ProcessPoolExecutor initializer: log through the parent's listener and publish metrics.
+    # Ctrl+C reaches the whole process group; the parent shuts the pool down and workers
+    # finish the file in hand instead of dying mid-load.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    attach_to_queue(log_queue)
+    start_worker_metrics()
+    get_dedup_index()
+
+
+# Runs process_file on a bounded worker pool. submit() blocks once max_pending files are
+# queued or running, pushing back on the watchdog observer instead of growing an unbounded
+# backlog, and a path that is already queued or running is not submitted twice.
+# With micro-batching on, small files are held back until batch_files of them are waiting
+# or batch_latency seconds have passed since the first, then handed to one process_batch call.
+class FileDispatcher:
+
+    def __init__(self, mode=WORKER_MODE, max_workers=MAX_WORKERS, max_pending=MAX_PENDING_FILES,
+                 batch_files=MICRO_BATCH_MAX_FILES, batch_latency=MICRO_BATCH_LATENCY,
+                 batch_max_bytes=MICRO_BATCH_MAX_FILE_BYTES):
+        if mode == 'process':
+            # Spawned workers import the DB layer fresh instead of inheriting the parent's sockets.
+            self._executor = ProcessPoolExecutor(max_workers=max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker_process,
+                                                 initargs=(worker_log_queue(),))
+        elif mode == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='file-worker')
+            # The threads share this process's dedup index; warm it before the first file arrives.
+            threading.Thread(target=get_dedup_index, name='dedup-warm', daemon=True).start()
+        else:
+            raise ValueError(f"Unknown worker mode: {mode}")
+
+        self._slots = threading.BoundedSemaphore(max(max_pending, max_workers))
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._batch_files = batch_files
+        self._batch_latency = batch_latency
+        self._batch_max_bytes = batch_max_bytes
+        self._batch = []
+        self._batch_timer = None
+        logger.info(f"File dispatcher started with {max_workers} {mode} workers, max {max_pending} pending files"
+                    f"{f', micro-batches of up to {batch_files} files' if batch_files else ''}.")
+
+    def submit(self, file_path, func=process_file, **kwargs):
+        path = os.path.abspath(file_path)
+        with self._lock:
+            if self._closed:
+                logger.warning(f"Dispatcher is shutting down, not accepting file: {path}")
+                return False
+            if path in self._in_flight:
+                logger.info(f"File already queued or in progress, skipping: {path}")
+                return False
+            self._in_flight.add(path)
+            set_gauge('dispatcher_pending_files', len(self._in_flight))
+
+        self._slots.acquire()
+        if func is process_file and self._batchable(path):
+            self._add_to_batch(path, kwargs.get('wait_for_ready', False))
+            return True
+        try:
+            future = self._executor.submit(func, path, **kwargs)
+        except Exception:
+            self._release(path)
+            raise
+        future.add_done_callback(lambda f, p=path: self._on_done(p, f))
+        return True
+
+    def _batchable(self, path):
+        if not self._batch_files:
+            return False
+        try:
+            return os.path.getsize(path) <= self._batch_max_bytes
+        except OSError:
+            return False
+
+    def _add_to_batch(self, path, wait_for_ready):
+        with self._lock:
+            self._batch.append((path, wait_for_ready))
+            if len(self._batch) < self._batch_files:
+                if self._batch_timer is None:
+                    self._batch_timer = threading.Timer(self._batch_latency, self.flush_batch)
+                    self._batch_timer.daemon = True
+                    self._batch_timer.start()
+                return
+        self.flush_batch()
+
+    def flush_batch(self):
+        with self._lock:
+            files, self._batch = self._batch, []
+            if self._batch_timer is not None:
+                self._batch_timer.cancel()
+                self._batch_timer = None
+        if not files:
+            return
+        paths = [path for path, _ in files]
+        inc('dispatcher_batches_total')
+        try:
+            future = self._executor.submit(process_batch, files)
+        except Exception as e:
+            logger.error(f"Could not submit micro-batch of {len(files)} files: {e}")
+            for path in paths:
+                self._release(path)
+            return
+        future.add_done_callback(lambda f, p=paths: self._on_batch_done(p, f))
+
+    def pending(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def _release(self, path):
+        with self._lock:
+            self._in_flight.discard(path)
+            set_gauge('dispatcher_pending_files', len(self._in_flight))
+        self._slots.release()
+
+    def _on_done(self, path, future):
+        self._release(path)
+        if future.cancelled():
+            return
+        error = future.exception()
+        inc('dispatcher_files_total', result='failed' if error is not None else 'done')
+        if error is not None:
+            logger.error(f"Worker failed for file {path}: {error}")
+            log_error(path, str(error))
+
+    def _on_batch_done(self, paths, future):
+        for path in paths:
+            self._on_done(path, future)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._closed = True
+            remaining = len(self._in_flight)
+        logger.info(f"Shutting down file dispatcher, draining {remaining} pending files.")
+        self.flush_batch()
+        self._executor.shutdown(wait=wait)
+        logger.info("File dispatcher stopped.")
@@ -1,83 +1,219 @@
 from datetime import datetime
+import atexit
 import os
+import threading
+import time
 import pandas as pd
 from src.logger import get_logger
-from config.settings import  LOG_DIR, QUARANTINE_DIR
+from src.metrics import timed
+from config.settings import  LOG_DIR, QUARANTINE_DIR, RAW_LOAD_METHOD, QUARANTINE_FORMAT, ERROR_LOG_FLUSH_INTERVAL
 from db.retry_utils import retry_operation
-from src.aggregation import calculate_aggregated_metrics
-from db.db_utils import get_db_connection, release_db_connection,create_tables_if_not_exist,insert_raw_data,insert_aggregated_data
+from src.aggregation import calculate_partial_metrics, calculate_bucket_metrics, calculate_metrics_by_file, finalize_metrics, SOURCE_FILE_COLUMN
+from src.validation import REASON_COLUMN, CATEGORY_COLUMN
+from src.dedup import filter_known_rows, remember_rows
+from db.db_utils import db_connection,bootstrap_schema,ensure_raw_partitions,insert_raw_data,insert_aggregated_data,copy_raw_data,update_station_metrics,update_rollup_metrics,notify_station_updates,ROLLUPS,AGGREGATED_METRIC_COLUMNS
 
 logger = get_logger(__name__)
 
 
-def save_failed_rows(failed_df, reasons, file_path):
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+def _columnar_table(failed_df):
+    # Quarantined cells keep their raw, possibly mixed-type values, so object columns become strings.
+    columns = {column: failed_df[column].astype('string') for column in failed_df.select_dtypes(include='object')}
+    return pa.Table.from_pandas(failed_df.assign(**columns), preserve_index=False)
+
+
+def _save_failed_rows_columnar(failed_df, file_path, part, file_format):
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    extension = 'parquet' if file_format == 'parquet' else 'arrow'
+    date_dir = os.path.join(QUARANTINE_DIR, f"date={datetime.now():%Y-%m-%d}")
+
+    categories = failed_df[CATEGORY_COLUMN].fillna('other')
+    for category, group in failed_df.groupby(categories, sort=False):
+        partition_dir = os.path.join(date_dir, f"reason={category}")
+        os.makedirs(partition_dir, exist_ok=True)
+        quarantine_file = os.path.join(partition_dir, f"failed_{stem}-{part:05d}.{extension}")
+        table = _columnar_table(group.drop(columns=CATEGORY_COLUMN))
+        if file_format == 'parquet':
+            pq.write_table(table, quarantine_file)
+        else:
+            feather.write_feather(table, quarantine_file, compression='uncompressed')
+        logger.info(f"{len(group)} failed rows saved to: {quarantine_file}")
+
+
+def save_failed_rows(failed_df, reasons, file_path, part=0):
+    # part numbers the chunks of a streamed file: CSV output appends, columnar output
+    # writes one file per chunk and failure category.
     os.makedirs(QUARANTINE_DIR, exist_ok=True)
 
-    failed_df['Reason for Failure'] = reasons
+    if reasons is not None:
+        failed_df[REASON_COLUMN] = reasons
+    if CATEGORY_COLUMN not in failed_df.columns:
+        failed_df[CATEGORY_COLUMN] = 'other'
+
+    file_format = QUARANTINE_FORMAT
+    if file_format in ('parquet', 'arrow') and pa is None:
+        logger.warning(f"pyarrow is not installed, writing {file_format} quarantine output as CSV instead.")
+        file_format = 'csv'
+
+    if file_format != 'csv':
+        if not failed_df.empty:
+            _save_failed_rows_columnar(failed_df, file_path, part, file_format)
+        return
+
     base_name = os.path.basename(file_path)
     quarantine_file = os.path.join(QUARANTINE_DIR, f"failed_{base_name}")
 
-    failed_df.to_csv(quarantine_file, index=False)
+    if part > 0:
+        failed_df.to_csv(quarantine_file, index=False, mode='a', header=False)
+    else:
+        failed_df.to_csv(quarantine_file, index=False)
     logger.info(f"Failed rows saved to: {quarantine_file}")
 
 
+# Error-log lines are buffered per process instead of an open/append per error; a background
+# thread flushes them every ERROR_LOG_FLUSH_INTERVAL seconds. Each flush appends whole lines in
+# one O_APPEND write, so worker processes sharing the file never split each other's lines.
+class BufferedLogWriter:
+    def __init__(self, path, flush_interval=ERROR_LOG_FLUSH_INTERVAL, max_buffer=64 * 1024):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._fd = None
+        self._lines = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def write(self, line):
+        with self._lock:
+            self._lines.append(line)
+            self._buffered += len(line)
+            if self._buffered >= self.max_buffer:
+                self._flush_lines()
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, name='error-log-flush', daemon=True)
+                self._flusher.start()
+
+    def _flush_lines(self):
+        if not self._lines:
+            return
+        data = ''.join(self._lines).encode()
+        self._lines = []
+        self._buffered = 0
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            atexit.register(self.close)
+        os.write(self._fd, data)
+
+    def flush(self):
+        with self._lock:
+            self._flush_lines()
+
+    def close(self):
+        with self._lock:
+            self._flush_lines()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+_error_log = BufferedLogWriter(os.path.join(LOG_DIR, "error_log.txt"))
+
+
 def log_error(file_path, error_message):
    
-    os.makedirs(LOG_DIR, exist_ok=True)
-    error_log_file = os.path.join(LOG_DIR, "error_log.txt")
-
-    with open(error_log_file, 'a') as log:
-        log.write(f"{datetime.now()} - {file_path} - {error_message}\n")
+    _error_log.write(f"{datetime.now()} - {file_path} - {error_message}\n")
 
     logger.error(f"Error logged: {error_message}")
 
-def save_valid_data(df, file_path):
+
+def flush_error_log():
+    _error_log.flush()
+
+RAW_COLUMNS = ['Station Name', 'Measurement Timestamp', 'Air Temperature',
+               'Humidity', 'Barometric Pressure', 'Measurement ID']
+
+
+def _aggregated_rows(aggregated_metrics_temp):
+    return list(aggregated_metrics_temp[['Source File', 'Station Name'] + AGGREGATED_METRIC_COLUMNS]
+                .itertuples(index=False, name=None))
+
+
+@timed('save_valid_data')
+def save_valid_data(df, file_path, aggregate=True):
+    # A micro-batch passes file_path=None and tags each row with its Source File instead,
+    # so the per-file aggregates are still written from the one shared transaction.
+    # A micro-batch holds several files, and each file's metrics count its own repeats once.
+    per_file = [SOURCE_FILE_COLUMN] if SOURCE_FILE_COLUMN in df.columns else []
+    file_df = df[~df.duplicated(per_file + ['Measurement ID'])]
+    df = filter_known_rows(df)
+    if df.empty and not aggregate:
+        logger.info('All rows are already loaded, skipping database write')
+        return df
+
     def db_operations():
 
-        
-        raw_data = [
-            (
-                row['Station Name'],
-                row['Measurement Timestamp'],
-                row['Air Temperature'],
-                row['Barometric Pressure'],
-                row['Humidity'],
-                row['Measurement ID']
-            )
-            for _, row in df.iterrows()
-        ]
-
-        conn = get_db_connection()
-        create_tables_if_not_exist(conn)
-        cursor = conn.cursor()
-        
-        successfully_inserted_df = insert_raw_data(conn, cursor, raw_data,df.columns)
-        
-        
-        aggregated_metrics_temp = calculate_aggregated_metrics(successfully_inserted_df, file_path)
-        aggregated_metrics = [
-            (
-                row['Source File'],
-                row['Station Name'],
-                row['min_temp'],
-                row['max_temp'],
-                row['avg_temp'],
-                row['std_temp'],
-                row['min_humidity'],
-                row['max_humidity'],
-                row['avg_humidity'],
-                row['std_humidity'],
-                row['min_pressure'],
-                row['max_pressure'],
-                row['avg_pressure'],
-                row['std_pressure']
-            )
-            for _, row in aggregated_metrics_temp.iterrows()
-        ]
-        
-        insert_aggregated_data(conn, cursor, aggregated_metrics)
-        conn.commit()
-        release_db_connection(conn)
+        bootstrap_schema()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            inserted_ids = []
+            if not df.empty:
+                ensure_raw_partitions(conn, df['Measurement Timestamp'])
+                if RAW_LOAD_METHOD == 'copy':
+                    inserted_ids = copy_raw_data(conn, cursor, df, RAW_COLUMNS)
+                else:
+                    inserted_ids = insert_raw_data(conn, cursor, df, RAW_COLUMNS)
+
+            # Aggregate over a mask of the inserted rows instead of rebuilding a frame from tuples.
+            inserted_mask = df['Measurement ID'].isin(inserted_ids) & ~df['Measurement ID'].duplicated()
+            successfully_inserted_df = df[inserted_mask]
+
+            partial_metrics = calculate_partial_metrics(successfully_inserted_df)
+            update_station_metrics(cursor, partial_metrics)
+            if not successfully_inserted_df.empty:
+                for granularity, (_, freq, _) in ROLLUPS.items():
+                    update_rollup_metrics(cursor, granularity, calculate_bucket_metrics(successfully_inserted_df, freq))
+                # Delivered at commit, so query caches drop these stations only once the rows are visible.
+                notify_station_updates(cursor, successfully_inserted_df['Station Name'].unique())
+            if aggregate:
+                # Per-file metrics cover every valid row of the file, including rows an earlier
+                # delivery or attempt already loaded, so overwriting a stored row is idempotent.
+                if SOURCE_FILE_COLUMN in file_df.columns:
+                    aggregated_metrics_temp = calculate_metrics_by_file(file_df)
+                else:
+                    aggregated_metrics_temp = finalize_metrics(calculate_partial_metrics(file_df), file_path)
+                insert_aggregated_data(conn, cursor, _aggregated_rows(aggregated_metrics_temp))
+            conn.commit()
+        # COPY leaves every row either inserted or already present; the row-wise path
+        # may also have rejected rows for other reasons, so only its inserts are known.
+        remember_rows(df if RAW_LOAD_METHOD == 'copy' else successfully_inserted_df)
         logger.info('Data insertion and aggregation completed')
+        return successfully_inserted_df
+
+    return retry_operation(db_operations, max_retries=3, delay=2, backoff=2, file_path="Database Operations")
+
+
+def save_aggregated_data(aggregated_metrics_temp):
+    def db_operations():
+        bootstrap_schema()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            insert_aggregated_data(conn, cursor, _aggregated_rows(aggregated_metrics_temp))
+            conn.commit()
+        logger.info('Aggregated metrics insertion completed')
 
     retry_operation(db_operations, max_retries=3, delay=2, backoff=2, file_path="Database Operations")
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from config.settings import LEDGER_PATH
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def content_hash(file_path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as source:
+        for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Durable record of ingested files in a local SQLite database, so restarts can skip
+# them without touching PostgreSQL. Keyed by (path, size, mtime) for an O(1) check
+# from a stat() alone, with the content hash indexed to catch copies under new names.
+class FileLedger:
+    def __init__(self, path=LEDGER_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS processed_files (
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    processed_at TEXT NOT NULL,
+                    PRIMARY KEY (path, size, mtime_ns)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_files_hash ON processed_files (content_hash)")
+
+    def is_processed(self, file_path, signature):
+        size, mtime_ns = signature
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM processed_files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (os.path.abspath(file_path), size, mtime_ns)).fetchone()
+        return row is not None
+
+    def find_by_hash(self, digest):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path FROM processed_files WHERE content_hash = ? LIMIT 1", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, file_path, signature, digest):
+        size, mtime_ns = signature
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO processed_files (path, size, mtime_ns, content_hash, processed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (os.path.abspath(file_path), size, mtime_ns, digest, datetime.now().isoformat()))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    # One ledger connection per process, opened on first use.
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = FileLedger()
+        return _ledger
@@ -1,30 +1,171 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import multiprocessing
 import os
-from config.settings import LOG_DIR
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from config.settings import (LOG_DIR, LOG_LEVEL, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+                             LOG_QUEUE_SIZE, LOG_RATE_LIMIT, LOG_RATE_INTERVAL)
 
 os.makedirs(LOG_DIR, exist_ok=True)
 
+TEXT_FORMAT = '%(asctime)s - %(filename)s - %(funcName)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'file': record.filename,
+            'function': record.funcName,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+# Allows `limit` WARNING records per call site every `interval` seconds; the next one let
+# through after a quiet spell reports how many were suppressed. Other levels always pass:
+# INFO/DEBUG narrate progress and ERROR must never be lost.
+class RateLimitFilter(logging.Filter):
+    def __init__(self, limit=LOG_RATE_LIMIT, interval=LOG_RATE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno != logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window_start, count, suppressed = self._sites.get(key, (now, 0, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+            if count >= self.limit:
+                self._sites[key] = (window_start, count, suppressed + 1)
+                return False
+            self._sites[key] = (window_start, count + 1, 0)
+        if suppressed:
+            record.msg = f"{record.getMessage()} [{suppressed} similar messages suppressed]"
+            record.args = None
+        return True
+
+
+# Never blocks the caller: when the listener falls behind and the queue is full, records are
+# dropped and the count is reported with the next record that fits.
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.dropped:
+            record.msg = f"{record.msg} [{self.dropped} log records dropped, queue full]"
+        try:
+            self.queue.put_nowait(record)
+            self.dropped = 0
+        except queue.Full:
+            self.dropped += 1
+
+
+def _formatter():
+    return JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+
+
+def _sinks():
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(LOG_DIR, "app.log"), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(_formatter())
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(_formatter())
+    return file_handler, console_handler
+
+
+# One queue handler per process is shared by every module logger. In the main process a
+# QueueListener thread drains it into the file and console sinks; worker processes call
+# attach_to_queue() so their records go to the parent's listener and a single writer owns
+# the rotating file.
+_handler = None
+_listener = None
+_shared_queue = None
+_setup_lock = threading.Lock()
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for sink in _listener.handlers:
+            sink.close()
+        _listener = None
+
+
+def _get_handler():
+    global _handler, _listener
+    with _setup_lock:
+        if _handler is None:
+            log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            _handler = NonBlockingQueueHandler(log_queue)
+            _handler.addFilter(RateLimitFilter())
+            _listener = logging.handlers.QueueListener(log_queue, *_sinks(), respect_handler_level=True)
+            _listener.start()
+            atexit.register(_stop_listener)
+        return _handler
+
+
+def worker_log_queue():
+    # A queue that spawned worker processes can write to; its records reach this process's sinks.
+    global _shared_queue
+    _get_handler()
+    with _setup_lock:
+        if _shared_queue is None:
+            _shared_queue = multiprocessing.get_context('spawn').Queue(maxsize=LOG_QUEUE_SIZE)
+            forwarder = threading.Thread(target=_forward, args=(_shared_queue,), name='log-forwarder', daemon=True)
+            forwarder.start()
+        return _shared_queue
+
+
+def _forward(source):
+    # Moves worker records onto this process's queue, so the one listener writes everything.
+    while True:
+        try:
+            record = source.get()
+        except (EOFError, OSError):
+            return
+        _handler.queue.put(record)
+
+
+def attach_to_queue(log_queue):
+    # Called in a worker process: route this process's records to the parent instead.
+    handler = _get_handler()
+    with _setup_lock:
+        _stop_listener()
+        handler.queue = log_queue
+
+
 def get_logger(name="CaseStudy"):
-    
+
     logger = logging.getLogger(name)
     if not logger.hasHandlers():  # Check if the logger already has handlers
-        logger.setLevel(logging.DEBUG)
-        log_file = os.path.join(LOG_DIR, "app.log")
-
-        # File handler
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.DEBUG)
-        file_format = logging.Formatter('%(asctime)s - %(filename)s - %(funcName)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(file_format)
-
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        console_format = logging.Formatter('%(asctime)s - %(filename)s - %(funcName)s - %(levelname)s - %(message)s')
-        console_handler.setFormatter(console_format)
-
-        # Add handlers to logger
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        logger.setLevel(getattr(logging, LOG_LEVEL, logging.DEBUG))
+        logger.addHandler(_get_handler())
 
     return logger
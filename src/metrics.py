@@ -0,0 +1,211 @@
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config.settings import METRICS_DIR, METRICS_DUMP_INTERVAL
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Upper bounds in seconds; the implicit +Inf bucket catches the rest.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+        histogram['buckets'][bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(stage):
+    # Records the wrapped call's latency as pipeline_stage_seconds{stage=...}.
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer('pipeline_stage_seconds', stage=stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'timestamp': time.time(),
+            'counters': [[name, dict(labels), value] for (name, labels), value in _counters.items()],
+            'gauges': [[name, dict(labels), value] for (name, labels), value in _gauges.items()],
+            'histograms': [[name, dict(labels), {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']}]
+                           for (name, labels), h in _histograms.items()],
+        }
+
+
+def merge_snapshots(snapshots):
+    # Counters, gauges and histograms are summed across processes.
+    counters, gauges, histograms = {}, {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap['counters']:
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, value in snap['gauges']:
+            key = _key(name, labels)
+            gauges[key] = gauges.get(key, 0) + value
+        for name, labels, h in snap['histograms']:
+            key = _key(name, labels)
+            merged = histograms.setdefault(key, {'buckets': [0] * len(h['buckets']), 'sum': 0.0, 'count': 0})
+            merged['buckets'] = [a + b for a, b in zip(merged['buckets'], h['buckets'])]
+            merged['sum'] += h['sum']
+            merged['count'] += h['count']
+    return counters, gauges, histograms
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (extra or [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+
+def render_prometheus(snapshots=None):
+    counters, gauges, histograms = merge_snapshots(snapshots if snapshots is not None else collect_snapshots())
+    lines = []
+    for kind, series in (('counter', counters), ('gauge', gauges)):
+        for name in sorted({name for name, _ in series}):
+            lines.append(f"# TYPE {name} {kind}")
+            for (series_name, labels), value in sorted(series.items()):
+                if series_name == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (series_name, labels), h in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(LATENCY_BUCKETS) + ['+Inf'], h['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {h['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {h['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def dump_json(path=None):
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = path or os.path.join(METRICS_DIR, f"metrics_{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as out:
+        json.dump(snapshot(), out)
+    os.replace(tmp_path, path)
+    return path
+
+
+def collect_snapshots():
+    # This process's live metrics plus the latest dumps of any other worker processes.
+    snapshots = [snapshot()]
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics_*.json')):
+        if path.endswith(f"metrics_{os.getpid()}.json"):
+            continue
+        try:
+            with open(path) as dump:
+                snapshots.append(json.load(dump))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read metrics dump {path}: {e}")
+    return snapshots
+
+
+def clear_dumps():
+    # Drops dumps left by processes of an earlier run so they are not merged in.
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics_*.json')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def start_json_dump(interval=METRICS_DUMP_INTERVAL):
+    # Periodically writes this process's metrics so a worker process is visible to the endpoint.
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                dump_json()
+            except OSError as e:
+                logger.warning(f"Failed to write metrics dump: {e}")
+
+    thread = threading.Thread(target=run, name='metrics-dump', daemon=True)
+    thread.start()
+    return thread
+
+
+def start_worker_metrics():
+    # ProcessPoolExecutor initializer for worker processes.
+    if METRICS_DUMP_INTERVAL > 0:
+        start_json_dump()
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = render_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body = json.dumps(collect_snapshots()).encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -1,32 +1,156 @@
+import os
+import threading
 import time
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from src.data_handler import process_file
+from src.dispatcher import FileDispatcher
+from src.queue_worker import QueueRegistrar, QueueWorkers
+from src.query_server import start_query_server
 from src.logger import get_logger
+from src.metrics import clear_dumps, start_json_dump, start_metrics_server
+from src.ledger import get_ledger
+from db.db_utils import close_connection_pool
+from src.readiness import file_signature
+from config.settings import METRICS_PORT, METRICS_DUMP_INTERVAL, FILE_STABLE_INTERVAL, WORK_QUEUE, QUERY_PORT
 
-from src.file_utils import log_error
+from src.file_utils import log_error, flush_error_log
 logger = get_logger(__name__)
 
+# Producers should either write in place (the close event marks completion) or write
+# to a temporary name such as data.csv.part and rename it to data.csv when done.
 class DataHandler(FileSystemEventHandler):
+    def __init__(self, dispatcher, close_events=False, created_grace=FILE_STABLE_INTERVAL):
+        super().__init__()
+        self.dispatcher = dispatcher
+        # With close events a file written in place is announced once it is complete.
+        self.close_events = close_events
+        self.created_grace = created_grace
+        self._created = {}
+        self._lock = threading.Lock()
+
     def on_created(self, event):
-        if event.src_path.endswith('.csv'):
-            logger.info(f"New file detected: {event.src_path}")
-            process_file(event.src_path)
+        if event.is_directory or not event.src_path.endswith('.csv'):
+            return
+        logger.info(f"New file detected: {event.src_path}")
+        if not self.close_events:
+            # The producer may still be writing, so the worker waits for the file to settle.
+            self.dispatcher.submit(event.src_path, wait_for_ready=True)
+            return
+        # A file moved in from another directory or hard-linked in gets no close or rename
+        # event, so it is submitted with a readiness wait unless its close event arrives soon.
+        timer = threading.Timer(self.created_grace, self._created_timeout, args=(event.src_path,))
+        timer.daemon = True
+        with self._lock:
+            previous = self._created.get(event.src_path)
+            self._created[event.src_path] = timer
+        if previous is not None:
+            previous.cancel()
+        timer.start()
+
+    def _created_timeout(self, path):
+        with self._lock:
+            if self._created.get(path) is not threading.current_thread():
+                return
+            del self._created[path]
+        logger.info(f"No close event for {path}, waiting for it to settle.")
+        self.dispatcher.submit(path, wait_for_ready=True)
+
+    def _announced(self, path):
+        with self._lock:
+            timer = self._created.pop(path, None)
+        if timer is not None:
+            timer.cancel()
+
+    def cancel_pending(self):
+        # Files still waiting for their close event are picked up by the next startup scan.
+        with self._lock:
+            timers = list(self._created.values())
+            self._created.clear()
+        for timer in timers:
+            timer.cancel()
+
+    def on_closed(self, event):
+        # Closed after writing (inotify only): the file is complete.
+        if not event.is_directory and event.src_path.endswith('.csv'):
+            logger.info(f"File closed after writing: {event.src_path}")
+            self._announced(event.src_path)
+            self.dispatcher.submit(event.src_path)
+
+    def on_moved(self, event):
+        # Atomic rename into the watched name: the file is complete.
+        if not event.is_directory and event.dest_path.endswith('.csv'):
+            logger.info(f"File renamed into place: {event.dest_path}")
+            self._announced(event.dest_path)
+            self.dispatcher.submit(event.dest_path)
+
+def scan_backlog(directory, dispatcher):
+    # Catches up on files that arrived while the service was down. Files already in the
+    # ledger are skipped from a stat() alone; the rest go to the worker pool oldest first.
+    ledger = get_ledger()
+    candidates = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith('.csv'):
+                signature = file_signature(entry.path)
+                if signature is not None and not ledger.is_processed(entry.path, signature):
+                    candidates.append((signature[1], entry.path))
+
+    logger.info(f"Startup scan found {len(candidates)} unprocessed files in {directory}.")
+    settle_ns = int(2 * FILE_STABLE_INTERVAL * 1e9)
+    for mtime_ns, path in sorted(candidates):
+        # Only a file touched moments ago may still be in the middle of being written.
+        dispatcher.submit(path, wait_for_ready=time.time_ns() - mtime_ns < settle_ns)
+    return len(candidates)
+
+def _reports_close_events(observer):
+    # Only the inotify backend (Linux) emits close events.
+    try:
+        from watchdog.observers.inotify import InotifyObserver
+    except ImportError:
+        return False
+    return isinstance(observer, InotifyObserver)
 
 def monitor_directory(directory):
     logger.info(f"Monitoring directory: {directory}")
-    event_handler = DataHandler()
+    clear_dumps()
+    if METRICS_DUMP_INTERVAL > 0:
+        start_json_dump()
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = start_metrics_server(METRICS_PORT)
+    query_server = None
+    if QUERY_PORT:
+        query_server = start_query_server(QUERY_PORT)
+    queue_workers = None
+    if WORK_QUEUE:
+        # Every instance registers what it sees; the queue hands each file to exactly one worker.
+        dispatcher = QueueRegistrar(directory)
+        queue_workers = QueueWorkers(directory).start()
+    else:
+        dispatcher = FileDispatcher()
     observer = Observer()
+    event_handler = DataHandler(dispatcher, close_events=_reports_close_events(observer))
     observer.schedule(event_handler, directory, recursive=False)
     observer.start()
     try:
+        scan_backlog(directory, dispatcher)
         while True:
             time.sleep(5)
     except KeyboardInterrupt:
         logger.info("Stopping directory monitor due to keyboard interrupt.")
-        observer.stop()
     except Exception as e:
         logger.error(f"Unexpected error in monitor: {e}")
         log_error(directory, str(e))  
     finally:
+        observer.stop()
         observer.join()
+        event_handler.cancel_pending()
+        dispatcher.shutdown(wait=True)
+        if queue_workers is not None:
+            queue_workers.shutdown(wait=True)
+        close_connection_pool()
+        flush_error_log()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if query_server is not None:
+            query_server.shutdown()
@@ -0,0 +1,48 @@
+import queue
+import threading
+from config.settings import PIPELINE_BUFFER_CHUNKS
+from src.metrics import set_gauge
+
+_DONE = object()
+
+
+def overlapped(items, stage, buffer_size=PIPELINE_BUFFER_CHUNKS):
+    # Runs stage() over items on a background thread and yields the results in order, at most
+    # buffer_size ahead of the consumer. pandas parsing and psycopg2 I/O both release the GIL,
+    # so chunk N+1 is parsed and validated while the caller writes chunk N to the database.
+    results = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                results.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((True, stage(item))):
+                    return
+            put((True, _DONE))
+        except BaseException as e:
+            put((False, e))
+
+    worker = threading.Thread(target=produce, name='pipeline-stage', daemon=True)
+    worker.start()
+    try:
+        while True:
+            ok, value = results.get()
+            set_gauge('pipeline_buffer_depth', results.qsize())
+            if not ok:
+                raise value
+            if value is _DONE:
+                return
+            yield value
+    finally:
+        # Also reached when the consumer fails or stops early: unblock and wait for the producer.
+        stop.set()
+        worker.join()
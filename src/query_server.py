@@ -0,0 +1,81 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from db.queries import latest_readings, window_metrics, top_stations, start_invalidation_listener
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _first(params, name, default=None):
+    values = params.get(name)
+    return values[0] if values else default
+
+
+def _latest(params):
+    return latest_readings(station_names=params.get('station'))
+
+
+def _window(params):
+    return window_metrics(_first(params, 'start'), _first(params, 'end'),
+                          granularity=_first(params, 'granularity', 'hourly'),
+                          station_names=params.get('station'))
+
+
+def _top(params):
+    return top_stations(metric=_first(params, 'metric', 'avg_temp'), n=int(_first(params, 'n', 10)),
+                        start=_first(params, 'start'), end=_first(params, 'end'),
+                        ascending=_first(params, 'order', 'desc') == 'asc')
+
+
+# GET /stations/latest?station=A&station=B
+# GET /stations/metrics?start=2024-01-01&end=2024-01-02&granularity=hourly|daily[&station=A]
+# GET /stations/top?metric=avg_temp&n=10[&start=...&end=...][&order=asc|desc]
+ROUTES = {
+    '/stations/latest': _latest,
+    '/stations/metrics': _window,
+    '/stations/top': _top,
+}
+
+
+class _QueryRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        route = ROUTES.get(url.path)
+        if route is None:
+            self.send_error(404)
+            return
+        try:
+            frame = route(parse_qs(url.query))
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            logger.error(f"Query {self.path} failed: {e}")
+            self._send_json(500, {'error': 'Query failed'})
+            return
+        body = frame.to_json(orient='records', date_format='iso').encode()
+        self._send_body(200, body)
+
+    def _send_json(self, status, payload):
+        self._send_body(status, json.dumps(payload).encode())
+
+    def _send_body(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_query_server(port, host='127.0.0.1'):
+    start_invalidation_listener()
+    server = ThreadingHTTPServer((host, port), _QueryRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name='query-server', daemon=True)
+    thread.start()
+    logger.info(f"Query endpoint listening on http://{host}:{server.server_address[1]}/stations/")
+    return server
@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from config.settings import (WORKER_MODE, MAX_WORKERS, WORK_QUEUE_HEARTBEAT, WORK_QUEUE_POLL_INTERVAL)
+from db.db_utils import bootstrap_schema, db_connection
+from db.retry_utils import retry_operation
+from db.work_queue import enqueue_files, claim_files, renew_leases, finish_file
+from src.data_handler import process_file
+from src.dedup import get_dedup_index
+from src.logger import get_logger, attach_to_queue, worker_log_queue
+from src.metrics import inc, start_worker_metrics
+from src.readiness import file_signature
+
+logger = get_logger(__name__)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _queue_operation(operation, *args, **kwargs):
+    def run():
+        bootstrap_schema()
+        with db_connection() as conn:
+            return operation(conn, *args, **kwargs)
+    return retry_operation(run, file_path="Work Queue")
+
+
+# Stands in for FileDispatcher when WORK_QUEUE is on: the watcher and startup scan register
+# files in the shared queue instead of running them, and queue workers on any host pick them up.
+class QueueRegistrar:
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def submit(self, file_path, wait_for_ready=False, **kwargs):
+        signature = file_signature(file_path)
+        if signature is None:
+            logger.warning(f"File disappeared before it could be queued: {file_path}")
+            return False
+        file_name = os.path.relpath(os.path.abspath(file_path), self.directory)
+        try:
+            added = _queue_operation(enqueue_files, [(file_name, *signature, wait_for_ready)])
+        except Exception as e:
+            logger.error(f"Could not register file {file_path} in the work queue: {e}")
+            return False
+        if added:
+            logger.info(f"Queued file {file_name}.")
+        return bool(added)
+
+    def pending(self):
+        return 0
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def _heartbeat(worker_id, stop_event):
+    while not stop_event.wait(WORK_QUEUE_HEARTBEAT):
+        try:
+            _queue_operation(renew_leases, worker_id)
+        except Exception as e:
+            logger.error(f"Could not renew work queue leases for {worker_id}: {e}")
+
+
+def run_queue_worker(directory, stop_event, worker_id=None):
+    # Claims one file at a time until stop_event is set. A heartbeat thread keeps the lease
+    # alive while a file is processed; if this worker dies, the lease lapses and another claims it.
+    worker_id = worker_id or default_worker_id()
+    # Separate from stop_event so the lease on the file in hand is renewed until it is finished.
+    heartbeat_stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(worker_id, heartbeat_stop),
+                     name='queue-heartbeat', daemon=True).start()
+    logger.info(f"Queue worker {worker_id} started.")
+
+    while not stop_event.is_set():
+        try:
+            claimed = _queue_operation(claim_files, worker_id)
+        except Exception as e:
+            logger.error(f"Queue worker {worker_id} could not claim files: {e}")
+            stop_event.wait(WORK_QUEUE_POLL_INTERVAL)
+            continue
+        if not claimed:
+            stop_event.wait(WORK_QUEUE_POLL_INTERVAL)
+            continue
+
+        for file_name, wait_for_ready, attempts in claimed:
+            file_path = os.path.join(directory, file_name)
+            inc('work_queue_claims_total', retry='yes' if attempts > 1 else 'no')
+            error = None
+            try:
+                process_file(file_path, wait_for_ready=wait_for_ready, raise_errors=True)
+            except Exception as e:
+                error = e
+            try:
+                _queue_operation(finish_file, worker_id, file_name,
+                                 signature=file_signature(file_path), error=error)
+            except Exception as e:
+                # The lease lapses on its own and the file is retried elsewhere.
+                logger.error(f"Could not record queue status of {file_name}: {e}")
+    heartbeat_stop.set()
+    logger.info(f"Queue worker {worker_id} stopped.")
+
+
+def _run_worker_process(directory, stop_event, log_queue):
+    # Ctrl+C reaches the whole process group; the parent sets stop_event instead.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    attach_to_queue(log_queue)
+    start_worker_metrics()
+    get_dedup_index()
+    run_queue_worker(directory, stop_event)
+
+
+# max_workers queue workers as spawned processes or threads, mirroring FileDispatcher's modes.
+class QueueWorkers:
+    def __init__(self, directory, mode=WORKER_MODE, max_workers=MAX_WORKERS):
+        self.directory = os.path.abspath(directory)
+        self._workers = []
+        if mode == 'process':
+            context = multiprocessing.get_context('spawn')
+            self._stop = context.Event()
+            for index in range(max_workers):
+                self._workers.append(context.Process(target=_run_worker_process,
+                                                     args=(self.directory, self._stop, worker_log_queue()),
+                                                     name=f'queue-worker-{index}', daemon=True))
+        elif mode == 'thread':
+            self._stop = threading.Event()
+            threading.Thread(target=get_dedup_index, name='dedup-warm', daemon=True).start()
+            for index in range(max_workers):
+                worker_id = f"{default_worker_id()}:{index}"
+                self._workers.append(threading.Thread(target=run_queue_worker,
+                                                      args=(self.directory, self._stop, worker_id),
+                                                      name=f'queue-worker-{index}', daemon=True))
+        else:
+            raise ValueError(f"Unknown worker mode: {mode}")
+        self.mode = mode
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+        logger.info(f"Started {len(self._workers)} {self.mode} queue workers for {self.directory}.")
+        return self
+
+    def shutdown(self, wait=True):
+        # Workers finish the file in hand; unclaimed files stay queued for other instances.
+        self._stop.set()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        logger.info("Queue workers stopped.")
@@ -0,0 +1,64 @@
+import pandas as pd
+from config.settings import CRITICAL_COLUMNS, CSV_DTYPES, CSV_ENGINE, VALIDATION_RULES
+from src.logger import get_logger
+from src.metrics import timed
+
+logger = get_logger(__name__)
+
+# Used when a numeric column holds text that is not a recognised NA marker; validation
+# then coerces it and quarantines the bad cells with their raw values.
+FALLBACK_DTYPES = {**CSV_DTYPES, **{column: 'object' for column in VALIDATION_RULES}}
+
+
+def _read(file_path, dtypes, engine, **kwargs):
+    return pd.read_csv(file_path, usecols=CRITICAL_COLUMNS, dtype=dtypes, engine=engine, **kwargs)
+
+
+@timed('read_csv')
+def read_sensor_csv(file_path, engine=CSV_ENGINE):
+    # Clean files are parsed straight into their final dtypes, so numeric cells are
+    # converted once here and validation does not parse them again.
+    try:
+        return _read(file_path, CSV_DTYPES, engine)
+    except ValueError as e:
+        logger.info(f"Typed parse of {file_path} failed ({e}), re-reading numeric columns as text.")
+        return _read(file_path, FALLBACK_DTYPES, engine)
+
+
+def iter_sensor_csv(file_path, chunksize):
+    # Chunked variant. The file is opened here so open errors surface to the caller at once.
+    # If a chunk has dirty numeric text, reading resumes from that chunk with the text
+    # fallback; chunks already yielded are not read again.
+    reader = _read(file_path, CSV_DTYPES, 'c', chunksize=chunksize)
+    return _iter_chunks(file_path, chunksize, reader)
+
+
+def _iter_chunks(file_path, chunksize, reader):
+    consumed = 0
+    skip = 0
+    dtypes = CSV_DTYPES
+    while True:
+        try:
+            with reader:
+                for chunk in reader:
+                    if skip:
+                        dropped = min(skip, len(chunk))
+                        chunk = chunk.iloc[dropped:]
+                        skip -= dropped
+                        if chunk.empty:
+                            continue
+                    chunk.index = pd.RangeIndex(consumed, consumed + len(chunk))
+                    consumed += len(chunk)
+                    yield chunk
+            return
+        except ValueError as e:
+            if dtypes is FALLBACK_DTYPES:
+                raise
+            logger.info(f"Typed parse of {file_path} failed after {consumed} rows ({e}), "
+                        f"continuing with numeric columns as text.")
+            dtypes = FALLBACK_DTYPES
+            # Re-read from the start and drop the rows already yielded. Counting parsed rows
+            # rather than physical lines stays right with blank lines and quoted newlines.
+            skip = consumed
+            # The pyarrow parser does not support chunksize.
+            reader = _read(file_path, dtypes, 'c', chunksize=chunksize)
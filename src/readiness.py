@@ -0,0 +1,44 @@
+import os
+import time
+from config.settings import FILE_STABLE_INTERVAL, FILE_READY_TIMEOUT
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def file_signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def wait_until_stable(file_path, interval=FILE_STABLE_INTERVAL, timeout=FILE_READY_TIMEOUT):
+    # Used when no close or rename event tells us the producer is done: the file counts
+    # as complete once its size and mtime hold for one poll interval. A file that stays
+    # empty is complete too; the reader quarantines it rather than waiting for the timeout.
+    return file_path in wait_until_all_stable([file_path], interval, timeout)
+
+
+def wait_until_all_stable(file_paths, interval=FILE_STABLE_INTERVAL, timeout=FILE_READY_TIMEOUT):
+    # Polls many files in one loop, so a batch waits about one interval rather than one per
+    # file. Returns the paths that became stable.
+    deadline = time.monotonic() + timeout
+    previous = {path: file_signature(path) for path in file_paths}
+    ready = set()
+    while previous and time.monotonic() < deadline:
+        time.sleep(interval)
+        for path, signature in list(previous.items()):
+            current = file_signature(path)
+            if current is None:
+                logger.warning(f"File disappeared while waiting for it to be complete: {path}")
+                del previous[path]
+            elif current == signature:
+                ready.add(path)
+                del previous[path]
+            else:
+                previous[path] = current
+    for path in previous:
+        logger.warning(f"File {path} was still changing after {timeout} seconds.")
+    return ready
@@ -1,75 +1,111 @@
+import numpy as np
 import pandas as pd
-from config.settings import VALIDATION_RULES,CRITICAL_COLUMNS
+from config.settings import VALIDATION_RULES,CRITICAL_COLUMNS,TIMESTAMP_FORMAT
+from src.metrics import timed
 
+REASON_COLUMN = 'Reason for Failure'
+CATEGORY_COLUMN = 'Failure Category'
 
-def check_missing_values(df, failed_rows, reasons,logger):
-    logger.info("Starting check for missing critical fields...")
-    invalid_rows = pd.DataFrame()
 
-    for index,row in df.iterrows():
-        missing_fields = [col for col in CRITICAL_COLUMNS if pd.isnull(row[col])]
-        if missing_fields:
-            failed_rows.append(row.to_dict())
-            reasons.append(f"Missing critical fields: {', '.join(missing_fields)}")
-            invalid_rows = pd.concat([invalid_rows, pd.DataFrame([row])])
+@timed('check_missing_values')
+def check_missing_values(df):
+    # One boolean column per critical field, True where the field is missing.
+    return df[CRITICAL_COLUMNS].isnull()
 
-    valid_rows = df.dropna(subset=CRITICAL_COLUMNS)
-
-    if valid_rows.empty:
-        logger.warning("No valid rows left after checking for missing critical fields.")
-        return None, failed_rows, reasons
-
-    logger.info(f"Valid rows remaining after checking missing values: {len(valid_rows)}")
-    return valid_rows, failed_rows, reasons
-
-
-def validate_numeric_columns(df, failed_rows, reasons, logger):
-    logger.info("Starting validation for numeric columns...")
-    invalid_rows = pd.DataFrame()
 
+@timed('validate_numeric_columns')
+def validate_numeric_columns(df):
+    # Coerces the rule columns in place and flags unparseable or out-of-range values.
+    invalid = pd.DataFrame(index=df.index)
     for column, (min_val, max_val) in VALIDATION_RULES.items():
-        df[column] = pd.to_numeric(df[column], errors='coerce')
-        out_of_range_rows = df[(df[column].isnull()) | (~df[column].between(min_val, max_val))]
-
-        if not out_of_range_rows.empty:
-            logger.warning(f"Found {len(out_of_range_rows)} invalid or out-of-range entries in column: {column}")
-            for  index,row in out_of_range_rows.iterrows():
-                failed_rows.append(row.to_dict())
-                reasons.append(f"Invalid or out-of-range value in column: {column}")
-            invalid_rows = pd.concat([invalid_rows, out_of_range_rows])
-
-    valid_rows = df.drop(index=invalid_rows.index, errors='ignore')
-
-    if valid_rows.empty:
-        logger.warning("No valid rows left after numeric validation.")
-        return None, failed_rows, reasons
-
-    logger.info(f"Valid rows remaining after numeric validation: {len(valid_rows)}")
-    return valid_rows, failed_rows, reasons
-
-
-def validate_timestamp_format(df, failed_rows, reasons, logger):
-    logger.info("Starting timestamp format validation...")
-
-    invalid_rows = df[pd.to_datetime(df['Measurement Timestamp'], errors='coerce').isnull()]
-    
-    if not invalid_rows.empty:
-        logger.warning(f"Found {len(invalid_rows)} invalid timestamps.")
-        for  index,row in invalid_rows.iterrows():
-            failed_rows.append(row.to_dict())
-            reasons.append("Invalid timestamp format")
-    
-    valid_rows = df[~df.index.isin(invalid_rows.index)]
-    
-    if valid_rows.empty:
-        logger.warning("No valid rows left after timestamp validation.")
-        return None, failed_rows, reasons
-    
-    valid_rows['Measurement Timestamp'] = pd.to_datetime(valid_rows['Measurement Timestamp'])
-    logger.info("Converted 'Measurement Timestamp' to datetime format for valid rows.")
-    
-
-    logger.info(f"Remaining valid rows after timestamp validation: {len(valid_rows)}")
-    return valid_rows, failed_rows, reasons
-
-
+        if not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        invalid[column] = ~df[column].between(min_val, max_val)
+    return invalid
+
+
+def _parse_mixed(raw):
+    # Values with a UTC offset are converted to naive UTC, so offsets can differ between rows
+    # and still fit the naive column; values without one are kept as they are.
+    return pd.to_datetime(raw, errors='coerce', format='mixed', utc=True).dt.tz_convert(None)
+
+
+@timed('validate_timestamp_format')
+def validate_timestamp_format(df):
+    # Parses the timestamps once with the declared format; NaT marks an invalid entry.
+    # Values in another layout get one inferred parse so they are not rejected outright.
+    raw = df['Measurement Timestamp']
+    if pd.api.types.is_datetime64_any_dtype(raw):
+        return raw
+    if not TIMESTAMP_FORMAT:
+        return _parse_mixed(raw)
+    parsed = pd.to_datetime(raw, errors='coerce', format=TIMESTAMP_FORMAT)
+    retry = parsed.isnull() & raw.notnull()
+    if retry.any():
+        parsed[retry] = _parse_mixed(raw[retry])
+    return parsed
+
+
+def _join_flagged(flags, template):
+    # Builds "template(col1, col2)" style strings for the flagged columns of each row.
+    labels = pd.Index(flags.columns) + ', '
+    return template + flags.dot(labels).str.rstrip(', ')
+
+
+@timed('validate_dataframe')
+def validate_dataframe(df, logger):
+    logger.info("Starting validation of critical fields, numeric ranges and timestamps...")
+    raw_df = df
+    df = df.copy()
+
+    missing = check_missing_values(df)
+    missing_mask = missing.any(axis=1)
+
+    out_of_range = validate_numeric_columns(df)
+    out_of_range = out_of_range[~missing_mask]
+    timestamps = validate_timestamp_format(df)
+    bad_timestamp_mask = timestamps.isnull() & ~missing_mask
+
+    for column in VALIDATION_RULES:
+        count = int(out_of_range[column].sum())
+        if count:
+            logger.warning(f"Found {count} invalid or out-of-range entries in column: {column}")
+    if missing_mask.any():
+        logger.warning(f"Found {int(missing_mask.sum())} rows with missing critical fields.")
+    if bad_timestamp_mask.any():
+        logger.warning(f"Found {int(bad_timestamp_mask.sum())} invalid timestamps.")
+
+    range_mask = out_of_range.any(axis=1).reindex(df.index, fill_value=False)
+    failed_mask = missing_mask | range_mask | bad_timestamp_mask
+
+    failed_df = raw_df[failed_mask].copy()
+    if not failed_df.empty:
+        reasons = pd.Series('', index=failed_df.index)
+        flagged = missing_mask[failed_mask]
+        reasons[flagged] = _join_flagged(missing[failed_mask][flagged], "Missing critical fields: ")
+
+        rest = ~flagged
+        range_flags = out_of_range.reindex(failed_df.index, fill_value=False)[rest]
+        for column in VALIDATION_RULES:
+            hit = range_flags.index[range_flags[column]]
+            reasons[hit] = reasons[hit] + f"Invalid or out-of-range value in column: {column}; "
+        ts_hit = bad_timestamp_mask[failed_mask] & rest
+        reasons[ts_hit] = reasons[ts_hit] + "Invalid timestamp format"
+        failed_df[REASON_COLUMN] = reasons.str.rstrip('; ')
+        # First failing rule of each row, used to partition columnar quarantine output.
+        failed_df[CATEGORY_COLUMN] = np.select(
+            [flagged.to_numpy(), range_mask[failed_mask].to_numpy()],
+            ['missing_fields', 'out_of_range'],
+            default='invalid_timestamp')
+    else:
+        failed_df[REASON_COLUMN] = pd.Series(dtype=object)
+        failed_df[CATEGORY_COLUMN] = pd.Series(dtype=object)
+
+    valid_df = df[~failed_mask]
+    if valid_df.empty:
+        logger.warning("No valid rows left after validation.")
+        return None, failed_df
+
+    valid_df = valid_df.assign(**{'Measurement Timestamp': timestamps[~failed_mask]})
+    logger.info(f"Valid rows remaining after validation: {len(valid_df)}, failed rows: {len(failed_df)}")
+    return valid_df, failed_df